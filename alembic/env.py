@@ -4,15 +4,12 @@ from sqlalchemy import pool
 from sqlalchemy.engine.url import URL
 from alembic import context
 from app.models import Base
-from dotenv import load_dotenv
-import os
+from app.settings import settings
 
 target_metadata = Base.metadata
 
-load_dotenv()
-
 config = context.config
-config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL"))
+config.set_main_option("sqlalchemy.url", settings.database_url)
 fileConfig(config.config_file_name)
 
 
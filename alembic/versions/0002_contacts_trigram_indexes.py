@@ -0,0 +1,40 @@
+"""Trigram indexes for contact search
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_FIELDS = ("first_name", "last_name", "email")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for field in SEARCH_FIELDS:
+        op.create_index(
+            f"ix_contacts_{field}_trgm",
+            "contacts",
+            [field],
+            postgresql_using="gin",
+            postgresql_ops={field: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for field in SEARCH_FIELDS:
+        op.drop_index(f"ix_contacts_{field}_trgm", table_name="contacts")
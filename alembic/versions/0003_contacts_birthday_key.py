@@ -0,0 +1,48 @@
+"""Indexed birthday key on contacts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("contacts", sa.Column("birthday_key", sa.SmallInteger()))
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "UPDATE contacts SET birthday_key ="
+            " EXTRACT(MONTH FROM birth_date) * 100 + EXTRACT(DAY FROM birth_date)"
+        )
+    else:
+        op.execute(
+            "UPDATE contacts SET birthday_key ="
+            " CAST(strftime('%m%d', birth_date) AS INTEGER)"
+        )
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.alter_column(
+            "birthday_key", existing_type=sa.SmallInteger(), nullable=False
+        )
+    op.create_index(
+        "ix_contacts_user_id_birthday_key",
+        "contacts",
+        ["user_id", "birthday_key"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_contacts_user_id_birthday_key", table_name="contacts")
+    with op.batch_alter_table("contacts") as batch_op:
+        batch_op.drop_column("birthday_key")
@@ -0,0 +1,57 @@
+"""Unique email and phone number per user on contacts
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import logging
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Duplicates removed by the upgrade, kept until an operator drops them
+BACKUP_TABLE = "contacts_duplicates_0004"
+
+
+def upgrade() -> None:
+    # Concurrent creates could get past the old check; keep the oldest copy
+    # and move the others to BACKUP_TABLE, from which downgrade restores them
+    duplicates = (
+        "SELECT * FROM contacts WHERE id NOT IN ("
+        " SELECT MIN(id) FROM contacts GROUP BY user_id, email, phone_number)"
+    )
+    op.execute(f"CREATE TABLE {BACKUP_TABLE} AS {duplicates}")
+    count = op.get_bind().scalar(sa.text(f"SELECT COUNT(*) FROM {BACKUP_TABLE}"))
+    if count:
+        logger.warning(
+            "Moving %d duplicate contacts to %s; drop it once reviewed",
+            count,
+            BACKUP_TABLE,
+        )
+        op.execute(f"DELETE FROM contacts WHERE id IN (SELECT id FROM {BACKUP_TABLE})")
+    else:
+        op.drop_table(BACKUP_TABLE)
+    op.create_index(
+        "ix_contacts_user_id_email_phone_number",
+        "contacts",
+        ["user_id", "email", "phone_number"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_contacts_user_id_email_phone_number", table_name="contacts")
+    if sa.inspect(op.get_bind()).has_table(BACKUP_TABLE):
+        op.execute(f"INSERT INTO contacts SELECT * FROM {BACKUP_TABLE}")
+        op.drop_table(BACKUP_TABLE)
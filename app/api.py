@@ -1,88 +1,140 @@
-import jsonpickle as json
+import hashlib
 import jwt
+import math
 import os
+import time
 
-from fastapi import APIRouter, HTTPException, Depends, status, Request
+from calendar import isleap
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from typing import List, Optional
 from datetime import date, timedelta, datetime
-from dotenv import load_dotenv
 from functools import wraps
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from sqlalchemy.orm import Session
-from sqlalchemy import extract
-from passlib.context import CryptContext
-from app.cloudinary_utils import upload_image
+from sqlalchemy import or_, select, true
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.avatar_jobs import avatar_queue, get_job_status
+from app.contact_batch import BatchConflict, apply_batch, contact_values
+from app.contact_export import (
+    EXPORT_FORMATS,
+    accepts_gzip,
+    export_contacts,
+    parse_columns,
+)
+from app.contact_versions import (
+    bump_contacts_version,
+    etag_matches,
+    get_contacts_version,
+    make_etag,
+)
+from app.contact_import import (
+    IMPORT_FORMATS,
+    ContactImport,
+    iter_records,
+    parse_csv,
+    parse_ndjson,
+)
 from app.db import (
+    dialect_insert,
     get_db,
 )
 from app.email_utils import send_email
-from app.models import Contact, User
+from app.hashing import password_hasher
+from app.local_cache import LocalCache
+from app.models import Contact, User, birthday_key
+from app.rate_limit import RATE_LIMITS, rate_limiter
 from app.redis_client import RedisDB
+from app.response_cache import cache_key, response_cache
+from app.search import SEARCH_FIELDS, find_contacts
+from app.serialization import (
+    JSONBytesResponse,
+    contact_columns,
+    encode_contact,
+    encode_contacts,
+)
+from app.settings import settings
+from app.user_cache import cache_user, get_cached_user, invalidate_user
 from app.schemas import (
+    ContactBatch,
     ContactCreate,
+    ContactOperationResult,
     ContactRead,
+    CurrentUser,
     UserCreate,
     UserUpdateAvatar,
     UserAuthorize,
     UserResetPassword,
 )
 
-load_dotenv()
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-limiter = Limiter(key_func=get_remote_address)
 router = APIRouter()
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours in minutes
 PENGING_USER_EXPIRATION_TIME = 24 * 60 * 60  # 24 hours in seconds
 PENDING_PASSWORD_RESET_EXPIRATION_TIME = 30 * 60  # 30 minutes in seconds
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
+CONTACTS_PAGE_SIZE = 100  # Default page size for GET /contacts/
+CONTACTS_MAX_PAGE_SIZE = 1000
+CONTACTS_STREAM_BATCH_SIZE = 500  # Rows fetched per round trip when streaming
+SEARCH_RESULTS_LIMIT = 50  # Default number of search results
+BIRTHDAYS_WINDOW_DAYS = 7  # Default window of GET /birthdays
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+# Verified tokens, per worker; each entry lives until its token expires
+TOKEN_CACHE_SIZE = settings.token_cache_size
+TOKEN_CACHE_TTL = 5 * 60  # seconds, for tokens without an expiry
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+verified_tokens = LocalCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
 
 
 def pending_users_db():
     return RedisDB().select(RedisDB.DBs.PENDING_USERS)
 
 
-def current_active_users_db():
-    return RedisDB().select(RedisDB.DBs.CURRENT_ACTIVE_USERS)
-
-
 def pending_password_resets_db():
     return RedisDB().select(RedisDB.DBs.PENDING_PASSWORD_RESETS)
 
 
 # Dependency to verify JWT token
-def verify_token(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def verify_token(token: str = Depends(oauth2_scheme)):
     """
-    Verify the JWT token and return the payload
+    Verify the JWT token and return the payload. Verified payloads are
+    cached by token digest until the token expires.
 
     Args:
-        db (Session): The database session
         token (str): The JWT token
     """
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = verified_tokens.get(digest)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    exp = payload.get("exp")
+    if exp is None:
+        verified_tokens.set(digest, payload)
+    else:
+        # exp is wall-clock time, the cache runs on the monotonic clock
+        verified_tokens.set(
+            digest, payload, expires_at=time.monotonic() + (exp - time.time())
+        )
+    return payload
 
 
-def get_current_user(
-    payload: dict = Depends(verify_token), db: Session = Depends(get_db)
+async def get_current_user(
+    payload: dict = Depends(verify_token), db: AsyncSession = Depends(get_db)
 ):
     """
     Get the current user from the JWT token
 
     Args:
         payload (dict): The JWT token payload
-        db (Session): The database session
+        db (AsyncSession): The database session
     """
     email: str = payload.get("sub")
     if email is None:
@@ -91,120 +143,382 @@ def get_current_user(
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = None
-    if current_active_users_db().exists(email):
-        print("#1")
-        user = json.loads(current_active_users_db().get(email))
-    if not user:
-        print("#2")
-        user = db.query(User).filter(User.email == email).first()
-        current_active_users_db().set(email, json.dumps(user))
-        current_active_users_db().expire(email, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
+    user = await get_cached_user(email)
+    if user is None:
+        db_user = await db.scalar(select(User).where(User.email == email))
+        if db_user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+        user = CurrentUser.model_validate(db_user, from_attributes=True)
+        await cache_user(user)
 
     return user
 
 
-def get_user_contacts(
-    db: Session = Depends(get_db), user_id: User = Depends(get_current_user)
+async def get_optional_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
 ):
     """
-    Get the contacts for the current user
+    Get the current user if the request carries a valid token, else None
 
     Args:
-        db (Session): The database session
-        user (User): The user
+        token (str): The JWT token, if any
+        db (AsyncSession): The database session
     """
-    return db.query(Contact).filter(Contact.user_id == user_id.id)
+    if token is None:
+        return None
+    try:
+        return await get_current_user(await verify_token(token), db)
+    except HTTPException:
+        return None
+
+
+def rate_limit(route: str):
+    """
+    Return a dependency answering 429 Too Many Requests once the client
+    exceeds the limit of a route, set in RATE_LIMITS. Requests are counted
+    per user, or per IP address for anonymous requests.
+
+    Args:
+        route (str): The route, a key of RATE_LIMITS
+    """
+
+    async def check_rate_limit(
+        request: Request, user: Optional[CurrentUser] = Depends(get_optional_user)
+    ):
+        if user is not None:
+            key = f"user:{user.id}"
+        else:
+            key = f"ip:{request.client.host if request.client else 'unknown'}"
+        retry_after = await rate_limiter.hit(route, key)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded: {RATE_LIMITS[route]}",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    return check_rate_limit
+
+
+async def get_user_contacts(user: CurrentUser = Depends(get_current_user)):
+    """
+    Get the query selecting the contacts of the current user
+
+    Args:
+        user (CurrentUser): The user
+    """
+    return select(Contact).where(Contact.user_id == user.id)
+
+
+def contacts_etag(daily: bool = False):
+    """
+    Return a dependency tagging the response with an ETag derived from the
+    version of the user's contacts, which answers 304 Not Modified when the
+    client already has it, before the endpoint touches the database.
+
+    Args:
+        daily (bool): Whether the response also depends on today's date
+    """
+
+    async def check_etag(
+        request: Request,
+        response: Response,
+        user: CurrentUser = Depends(get_current_user),
+    ):
+        version = await get_contacts_version(user.id)
+        parts = [request.url.path, *sorted(request.query_params.multi_items())]
+        if daily:
+            parts.append(date.today())
+        etag = make_etag(version, *parts)
+        if etag_matches(etag, request.headers.get("If-None-Match")):
+            raise HTTPException(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+            )
+        response.headers["ETag"] = etag
+        request.state.contacts_version = version
+
+    return check_etag
+
+
+async def cached_json(request, response, user, endpoint, params, load):
+    """
+    Return a JSON response from the response cache, computing it with load
+    on a miss. Needs the contacts_etag dependency, whose version the cache
+    key includes: any change to the user's contacts invalidates it.
+
+    Args:
+        request (Request): The request
+        response (Response): The response object, whose headers are kept
+        user (CurrentUser): The user
+        endpoint (str): The endpoint name
+        params (dict): The endpoint parameters the response depends on
+        load: Coroutine function of a database session, returning the JSON
+            body and extra headers
+    """
+    key = cache_key(user.id, request.state.contacts_version, endpoint, params)
+    body, headers = await response_cache.get_or_load(key, load)
+    return JSONBytesResponse(body, headers={**response.headers, **headers})
 
 
 # Create a new contact
 @router.post(
     "/contacts/", response_model=ContactRead, status_code=status.HTTP_201_CREATED
 )
-def create_contact(
+async def create_contact(
     contact: ContactCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-    contacts=Depends(get_user_contacts),
+    db: AsyncSession = Depends(get_db),
+    user: CurrentUser = Depends(get_current_user),
 ):
     """
     Create a new contact
 
     Args:
         contact (ContactCreate): The contact to create
-        db (Session): The database session
-        user (User): The user
-        contacts (List[Contact]): The contacts for the user
-    """
-    # If email exists or phone exists- raise an error
-    existing_email = contacts.filter(
-        Contact.email == contact.email, Contact.phone_number == contact.phone_number
-    ).first()
-    if existing_email:
+        db (AsyncSession): The database session
+        user (CurrentUser): The user
+    """
+    # One statement: the unique (user_id, email, phone_number) index
+    # rejects a duplicate, even one created concurrently
+    db_contact = await db.scalar(
+        dialect_insert(db, Contact)
+        .values(**contact_values(contact), user_id=user.id)
+        .on_conflict_do_nothing(
+            index_elements=[Contact.user_id, Contact.email, Contact.phone_number]
+        )
+        .returning(Contact)
+    )
+    if db_contact is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Contact with this email already exists.",
         )
-    db_contact = Contact(
-        first_name=contact.first_name,
-        last_name=contact.last_name,
-        email=contact.email,
-        phone_number=contact.phone_number,
-        birth_date=contact.birth_date,
-        additional_info=contact.additional_info,
-        user_id=user.id,
-    )
-    db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
+    await db.commit()
+    await bump_contacts_version(user.id)
     return db_contact
 
 
+# Create, update and delete contacts in one request
+@router.post("/contacts/batch", response_model=List[ContactOperationResult])
+async def batch_contacts(
+    batch: ContactBatch,
+    db: AsyncSession = Depends(get_db),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Apply a list of contact operations in one transaction and return the
+    result of each, in order. A failing operation (unknown contact,
+    duplicate) is reported and skipped without affecting the others.
+
+    Args:
+        batch (ContactBatch): The operations
+        db (AsyncSession): The database session
+        user (CurrentUser): The user
+    """
+    try:
+        results = await apply_batch(db, user.id, batch.operations)
+    except BatchConflict:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The batch conflicts with existing contacts, nothing was applied.",
+        )
+    if any(result.status < status.HTTP_400_BAD_REQUEST for result in results):
+        await bump_contacts_version(user.id)
+    return results
+
+
+# Import contacts in bulk
+@router.post("/contacts/import")
+async def import_contacts(
+    request: Request,
+    format: str = Query("csv", pattern=f"^({'|'.join(IMPORT_FORMATS)})$"),
+    db: AsyncSession = Depends(get_db),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Import contacts from a CSV (with a header row) or NDJSON upload. The
+    body is read as a stream and loaded in chunks; invalid and duplicate
+    rows are skipped and listed in the returned report.
+
+    Args:
+        request (Request): The request, whose body is the upload
+        format (str): csv or ndjson
+        db (AsyncSession): The database session
+        user (CurrentUser): The user
+    """
+    parse = parse_csv if format == "csv" else parse_ndjson
+    rows = parse(iter_records(request.stream(), quoted=format == "csv"))
+    contact_import = ContactImport(db, user.id)
+    try:
+        return await contact_import.run(rows)
+    finally:
+        # Chunks are committed as they go, even if a later one fails
+        if contact_import.imported:
+            await bump_contacts_version(user.id)
+
+
 # Get all contacts
-@router.get("/contacts/", response_model=List[ContactRead])
-def get_contacts(db: Session = Depends(get_db), contacts=Depends(get_user_contacts)):
+@router.get(
+    "/contacts/",
+    response_class=JSONBytesResponse,
+    response_model=List[ContactRead],
+    dependencies=[Depends(contacts_etag())],
+)
+async def get_contacts(
+    request: Request,
+    response: Response,
+    limit: int = Query(CONTACTS_PAGE_SIZE, ge=1, le=CONTACTS_MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+    user: CurrentUser = Depends(get_current_user),
+    contacts=Depends(get_user_contacts),
+):
+    """
+    Get the contacts for the current user, ordered by id.
+
+    Results are paginated by keyset: pass the ``X-Next-Cursor`` header of
+    the previous page as ``after`` to get the next one. The header is
+    omitted on the last page. With ``stream=true`` every contact after
+    the cursor is streamed as NDJSON instead and ``limit`` is ignored.
+
+    Args:
+        request (Request): The request
+        response (Response): The response object
+        limit (int): The maximum number of contacts to return
+        after (Optional[int]): Return only contacts with a greater id
+        stream (bool): Stream the contacts as NDJSON
+        db (AsyncSession): The database session
+        user (CurrentUser): The user
+        contacts (List[Contact]): The contacts for the user
+    """
+    if after is not None:
+        contacts = contacts.where(Contact.id > after)
+    contacts = contacts.order_by(Contact.id)
+
+    if stream:
+        return StreamingResponse(
+            stream_contacts_ndjson(db, contacts),
+            media_type="application/x-ndjson",
+            headers=response.headers,
+        )
+
+    async def load(db):
+        page = (await db.execute(contact_columns(contacts).limit(limit + 1))).all()
+        headers = {}
+        if len(page) > limit:
+            page = page[:limit]
+            headers["X-Next-Cursor"] = str(page[-1].id)
+        return encode_contacts(page), headers
+
+    params = {"limit": limit, "after": after}
+    return await cached_json(request, response, user, "contacts", params, load)
+
+
+async def stream_contacts_ndjson(db, contacts):
+    """
+    Yield the contacts as NDJSON lines, reading them in batches from a
+    server-side cursor so memory use does not grow with the result size.
+
+    Args:
+        db (AsyncSession): The database session
+        contacts (List[Contact]): The contacts to stream
     """
-    Get all contacts for the current user
+    contacts = contact_columns(contacts).execution_options(
+        yield_per=CONTACTS_STREAM_BATCH_SIZE
+    )
+    async for rows in (await db.stream(contacts)).partitions():
+        yield b"".join(encode_contact(row) + b"\n" for row in rows)
+
+
+# Export all contacts
+@router.get("/contacts/export")
+async def export_user_contacts(
+    request: Request,
+    format: str = Query("csv", pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    columns: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    contacts=Depends(get_user_contacts),
+):
+    """
+    Stream all contacts of the user as CSV or NDJSON, gzipped when the
+    client accepts it.
 
     Args:
-        db (Session): The database session
+        request (Request): The request
+        format (str): csv or ndjson
+        columns (str): Comma separated columns to export, all by default
+        db (AsyncSession): The database session
         contacts (List[Contact]): The contacts for the user
     """
-    return contacts.all()
+    try:
+        columns = parse_columns(columns)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(error)
+        )
+    gzip = accepts_gzip(request.headers.get("Accept-Encoding"))
+    headers = {
+        "Content-Disposition": f'attachment; filename="contacts.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_contacts(db, contacts, columns, format, gzip),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers=headers,
+    )
 
 
 # Get one contact by id
-@router.get("/contacts/{contact_id}", response_model=ContactRead)
-def get_contact(
+@router.get(
+    "/contacts/{contact_id}",
+    response_class=JSONBytesResponse,
+    response_model=ContactRead,
+    dependencies=[Depends(contacts_etag())],
+)
+async def get_contact(
+    request: Request,
+    response: Response,
     contact_id: int,
+    user: CurrentUser = Depends(get_current_user),
     contacts=Depends(get_user_contacts),
 ):
     """
     Get a contact by id
 
     Args:
+        request (Request): The request
+        response (Response): The response object
         contact_id (int): The contact id
+        user (CurrentUser): The user
         contacts (List[Contact]): The contacts for the user
     """
-    contact = contacts.filter(Contact.id == contact_id).first()
-    if contact is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
-        )
-    return contact
+
+    async def load(db):
+        contact = (
+            await db.execute(contact_columns(contacts.where(Contact.id == contact_id)))
+        ).first()
+        if contact is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
+            )
+        return encode_contact(contact), {}
+
+    params = {"id": contact_id}
+    return await cached_json(request, response, user, "contact", params, load)
 
 
 # Update an existing contact
 @router.put("/contacts/{contact_id}", response_model=ContactRead)
-def update_contact(
+async def update_contact(
     contact_id: int,
     contact: ContactCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    user: CurrentUser = Depends(get_current_user),
     contacts=Depends(get_user_contacts),
 ):
     """
@@ -213,10 +527,11 @@ def update_contact(
     Args:
         contact_id (int): The contact id
         contact (ContactCreate): The contact to update
-        db (Session): The database session
+        db (AsyncSession): The database session
+        user (CurrentUser): The user
         contacts (List[Contact]): The contacts for the user
     """
-    db_contact = contacts.filter(Contact.id == contact_id).first()
+    db_contact = await db.scalar(contacts.where(Contact.id == contact_id))
     if db_contact is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
@@ -228,18 +543,26 @@ def update_contact(
     db_contact.phone_number = contact.phone_number
     db_contact.birth_date = contact.birth_date
     db_contact.additional_info = contact.additional_info
-    db_contact.user_id = contact.user_id
 
-    db.commit()
-    db.refresh(db_contact)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Contact with this email already exists.",
+        )
+    await bump_contacts_version(user.id)
+    await db.refresh(db_contact)
     return db_contact
 
 
 # Delete a contact
 @router.delete("/contacts/{contact_id}")
-def delete_contact(
+async def delete_contact(
     contact_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    user: CurrentUser = Depends(get_current_user),
     contacts=Depends(get_user_contacts),
 ):
     """
@@ -247,72 +570,127 @@ def delete_contact(
 
     Args:
         contact_id (int): The contact id
-        db (Session): The database session
+        db (AsyncSession): The database session
+        user (CurrentUser): The user
         contacts (List[Contact]): The contacts for the user
     """
-    db_contact = contacts.filter(Contact.id == contact_id).first()
+    db_contact = await db.scalar(contacts.where(Contact.id == contact_id))
     if db_contact is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
         )
 
-    db.delete(db_contact)
-    db.commit()
+    await db.delete(db_contact)
+    await db.commit()
+    await bump_contacts_version(user.id)
     return {"message": "Contact deleted successfully"}
 
 
 # Search contacts by first name, last name, or email
-@router.get("/search", response_model=List[ContactRead])
-def search_contacts(
+@router.get(
+    "/search",
+    response_class=JSONBytesResponse,
+    response_model=List[ContactRead],
+    dependencies=[Depends(contacts_etag())],
+)
+async def search_contacts(
+    request: Request,
+    response: Response,
     first_name: Optional[str] = None,
     last_name: Optional[str] = None,
     email: Optional[str] = None,
+    limit: int = Query(SEARCH_RESULTS_LIMIT, ge=1, le=CONTACTS_MAX_PAGE_SIZE),
+    user: CurrentUser = Depends(get_current_user),
     contacts=Depends(get_user_contacts),
 ):
     """
-    Search contacts by first name, last name, or email
+    Search contacts by first name, last name, or email.
+    Best matches come first.
 
     Args:
+        request (Request): The request
+        response (Response): The response object
         first_name (Optional[str]): The first name to search for
         last_name (Optional[str]): The last name to search for
         email (Optional[str]): The email to search for
+        limit (int): The maximum number of contacts to return
+        user (CurrentUser): The user
         contacts (List[Contact]): The contacts for the user
     """
-    if first_name:
-        contacts = contacts.filter(Contact.first_name.ilike(f"%{first_name}%"))
-    if last_name:
-        contacts = contacts.filter(Contact.last_name.ilike(f"%{last_name}%"))
-    if email:
-        contacts = contacts.filter(Contact.email.ilike(f"%{email}%"))
+    terms = dict(zip(SEARCH_FIELDS, (first_name, last_name, email)))
+    terms = {field: term for field, term in terms.items() if term}
+
+    async def load(db):
+        matches = await find_contacts(db, contact_columns(contacts), terms, limit)
+        return encode_contacts(matches), {}
 
-    return contacts.all()
+    params = {"terms": terms, "limit": limit}
+    return await cached_json(request, response, user, "search", params, load)
 
 
-# Get contacts with birthdays within the next 7 days
-@router.get("/birthdays", response_model=List[ContactRead])
-def get_upcoming_birthdays(contacts=Depends(get_user_contacts)):
+def birthdays_within(start: date, days: int):
     """
-    Get contacts with birthdays within the next 7 days
+    Build a filter matching contacts whose birthday falls between ``start``
+    and ``days`` days after it, both inclusive.
+
+    The window may wrap from December into January. In years without
+    February 29th those birthdays are celebrated on February 28th.
+
+    Args:
+        start (date): The first day of the window
+        days (int): The length of the window in days
+    """
+    if days >= 365:
+        return true()
+    end = start + timedelta(days=days)
+    start_key, end_key = birthday_key(start), birthday_key(end)
+    if end_key == 228 and not isleap(end.year):
+        end_key = 229
+    if start_key <= end_key:
+        return Contact.birthday_key.between(start_key, end_key)
+    return or_(Contact.birthday_key >= start_key, Contact.birthday_key <= end_key)
+
+
+# Get contacts with birthdays within the next days
+@router.get(
+    "/birthdays",
+    response_class=JSONBytesResponse,
+    response_model=List[ContactRead],
+    dependencies=[Depends(contacts_etag(daily=True))],
+)
+async def get_upcoming_birthdays(
+    request: Request,
+    response: Response,
+    days: int = Query(BIRTHDAYS_WINDOW_DAYS, ge=0, le=365),
+    user: CurrentUser = Depends(get_current_user),
+    contacts=Depends(get_user_contacts),
+):
+    """
+    Get contacts with birthdays within the next days, soonest first
 
     Args:
+        request (Request): The request
+        response (Response): The response object
+        days (int): The number of days to look ahead
+        user (CurrentUser): The user
         contacts (List[Contact]): The contacts for the user
     """
     today = date.today()
-    upcoming_months = [(today + timedelta(days=i)).month for i in range(8)]
-    upcoming_days = [(today + timedelta(days=i)).day for i in range(8)]
+    start_key = birthday_key(today)
+    contacts = contacts.where(birthdays_within(today, days)).order_by(
+        Contact.birthday_key < start_key, Contact.birthday_key, Contact.id
+    )
 
-    result = (
-        contacts.filter(
-            (extract("month", Contact.birth_date).in_(upcoming_months))
-        ).filter(extract("day", Contact.birth_date).in_(upcoming_days))
-    ).all()
+    async def load(db):
+        return encode_contacts((await db.execute(contact_columns(contacts))).all()), {}
 
-    return result
+    params = {"days": days, "today": today.isoformat()}
+    return await cached_json(request, response, user, "birthdays", params, load)
 
 
-# Hash password function
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# Hash password function, on the dedicated hashing threads
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
 def generate_confirmation_code():
@@ -321,9 +699,9 @@ def generate_confirmation_code():
 
 def admin_only(func):
     @wraps(func)
-    def wrapper(*args, **kwargs):
+    async def wrapper(*args, **kwargs):
         # Get current_user from the arguments
-        current_user: User = kwargs.get("current_user")
+        current_user: CurrentUser = kwargs.get("current_user")
 
         # Check if the current_user is an admin
         if current_user is None or current_user.role != "ADMIN":
@@ -333,29 +711,29 @@ def admin_only(func):
             )
 
         # Call the actual route function
-        return func(*args, **kwargs)
+        return await func(*args, **kwargs)
 
     return wrapper
 
 
 # Registration endpoint
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Register a new user
 
     Args:
         user (UserCreate): The user to register
-        db (Session): The database session
+        db (AsyncSession): The database session
     """
     # Check if the user with the same email already exists
-    if pending_users_db().exists(user.email):
+    if await pending_users_db().exists(user.email):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="User with this email already exists.",
         )
 
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -363,7 +741,7 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     # Hash the password
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
 
     # Create a new user and add to DB
     new_user = User(
@@ -376,11 +754,15 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
 
     confirmation_code = generate_confirmation_code()
 
-    pending_users_db().hset(
-        user.email, mapping={"user": json.dumps(new_user), "code": confirmation_code}
+    # jsonpickle is slow to import and only needed here, on registration
+    import jsonpickle
+
+    await pending_users_db().hset(
+        user.email,
+        mapping={"user": jsonpickle.dumps(new_user), "code": confirmation_code},
     )
-    pending_users_db().expire(user.email, PENGING_USER_EXPIRATION_TIME)
-    send_email(
+    await pending_users_db().expire(user.email, PENGING_USER_EXPIRATION_TIME)
+    await send_email(
         user.email,
         "Confirm your registration",
         f"Your confirmation code is: {confirmation_code}",
@@ -392,91 +774,101 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/authorize/register")
-def authorize_user(user: UserAuthorize, db: Session = Depends(get_db)):
+async def authorize_user(user: UserAuthorize, db: AsyncSession = Depends(get_db)):
     """
     Authorize a user
 
     Args:
         user (UserAuthorize): The user to authorize
-        db (Session): The database session
+        db (AsyncSession): The database session
     """
-    if not pending_users_db().exists(user.email):
+    # Read at once, as a concurrent request may remove it meanwhile
+    pending = await pending_users_db().hgetall(user.email)
+    if not pending:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    code = pending_users_db().hget(user.email, "code")
-    if code != user.confirmation_code:
+    if pending["code"] != user.confirmation_code:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid confirmation code"
         )
     # If the user is already in the DB, return an error
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="User with this email already exists.",
         )
     # Add the user to the DB
-    user_data: User = json.loads(pending_users_db().hget(user.email, "user"))
+    import jsonpickle
+
+    user_data: User = jsonpickle.loads(pending["user"])
     db.add(user_data)
-    db.commit()
-    db.refresh(user_data)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User with this email already exists.",
+        )
+    await db.refresh(user_data)
     # Remove the user from the pending users DB
-    pending_users_db().delete(user.email)
+    await pending_users_db().delete(user.email)
     return {"message": "User authorized successfully"}
 
 
 @router.post("/authorize/reset")
-def authorize_reset(user: UserAuthorize, db: Session = Depends(get_db)):
+async def authorize_reset(user: UserAuthorize, db: AsyncSession = Depends(get_db)):
     """
     Authorize a user for password reset
 
     Args:
         user (UserAuthorize): The user data to authorize
-        db (Session): The database session
+        db (AsyncSession): The database session
     """
-    if not pending_password_resets_db().exists(user.email):
+    # Read at once, as a concurrent request may remove it meanwhile
+    pending = await pending_password_resets_db().hgetall(user.email)
+    if not pending:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    code = pending_password_resets_db().hget(user.email, "code")
-    if code != user.confirmation_code:
+    if pending["code"] != user.confirmation_code:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid confirmation code"
         )
     # If the user is not in the DB, return an error
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if not existing_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     # Update the user's password
-    hashed_password = pending_password_resets_db().hget(user.email, "password")
-    existing_user.password = hashed_password
-    db.commit()
-    db.refresh(existing_user)
+    existing_user.password = pending["password"]
+    await db.commit()
     # Remove the user from the pending users DB
-    pending_password_resets_db().delete(user.email)
-    # Drop it from the current active users DB for security reasons
-    current_active_users_db().delete(user.email)
+    await pending_password_resets_db().delete(user.email)
+    # Drop it from the current active users cache for security reasons
+    await invalidate_user(user.email)
     return {"message": "Password reset successfully"}
 
 
 # Login endpoint
 @router.post("/login")
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Login a user and return an access token
 
     Args:
         form_data (OAuth2PasswordRequestForm): The form with login data
-        db (Session): The database session
+        db (AsyncSession): The database session
     """
-    user = db.query(User).filter(User.email == form_data.username).first()
+    user = await db.scalar(select(User).where(User.email == form_data.username))
 
-    if not user or not pwd_context.verify(form_data.password, user.password):
+    if not user or not await password_hasher.verify(form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -509,83 +901,99 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
-@router.get("/me", response_model=dict)
-@limiter.limit("5/minute")
-def get_me(request: Request, user: User = Depends(get_current_user)):
+@router.get("/me", response_model=dict, dependencies=[Depends(rate_limit("me"))])
+async def get_me(user: CurrentUser = Depends(get_current_user)):
     """
     Get the user info
 
     Args:
-        request (Request): The request object
-        current_user (User): The current user
+        user (CurrentUser): The current user
     """
     return {
         "id": user.id,
         "email": user.email,
         "avatar_url": user.avatar,
+        "avatar_variants": user.avatar_variants,
     }
 
 
-@router.post("/updateAvatar")
+@router.post("/updateAvatar", status_code=status.HTTP_202_ACCEPTED)
 @admin_only
-def update_avatar(
+async def update_avatar(
     avatar: UserUpdateAvatar,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     """
-    Update the user's avatar
+    Queue an update of the user's avatar. The image is uploaded in the
+    background; poll the returned job for its progress.
 
     Args:
         avatar (UserUpdateAvatar): The avatar to update
-        db (Session): The database session
-        user (User): The user
+        response (Response): The response object
+        current_user (CurrentUser): The user
     """
-    secure_url = upload_image(avatar.url)
-    user.avatar = secure_url
-    db.commit()
-    db.refresh(user)
-    current_active_users_db().set(user.email, json.dumps(user))
-    current_active_users_db().expire(user.email, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
-    return {"message": "Avatar updated successfully"}
+    job_id = await avatar_queue.enqueue(current_user.id, current_user.email, avatar.url)
+    response.headers["Location"] = f"/avatarJobs/{job_id}"
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/avatarJobs/{job_id}")
+async def get_avatar_job(
+    job_id: str, current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Get the progress of an avatar update: queued, uploading, done (with the
+    new avatar URL) or failed (with the error)
+
+    Args:
+        job_id (str): The job id returned by /updateAvatar
+        current_user (CurrentUser): The user
+    """
+    job = await get_job_status(job_id)
+    if not job or job.pop("user_id") != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    return {"job_id": job_id, **job}
 
 
 @router.post("/resetPassword")
-def reset_password(
+async def reset_password(
     user: UserResetPassword,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Reset the user's password
 
     Args:
         user (UserResetPassword): The user to reset the password for
-        db (Session): The database session
+        db (AsyncSession): The database session
     """
     # Check if the user with the same email already exists
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if not existing_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User with this email does not exist.",
         )
     # Check if the user has a pending password reset request
-    if pending_password_resets_db().exists(user.email):
+    if await pending_password_resets_db().exists(user.email):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Password reset request already exists.",
         )
 
-    hashed_password = hash_password(user.new_password)
+    hashed_password = await hash_password(user.new_password)
     confirmation_code = generate_confirmation_code()
-    pending_password_resets_db().hset(
+    await pending_password_resets_db().hset(
         user.email, mapping={"code": confirmation_code, "password": hashed_password}
     )
-    pending_password_resets_db().expire(
+    await pending_password_resets_db().expire(
         user.email, PENDING_PASSWORD_RESET_EXPIRATION_TIME
     )
 
-    send_email(
+    await send_email(
         user.email,
         "Confirm your password reset",
         f"Your confirmation code is: {confirmation_code}",
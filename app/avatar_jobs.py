@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import logging
+import orjson
+
+from dataclasses import dataclass
+from uuid import uuid4
+from app.cloudinary_utils import avatar_variants, fetch_image, upload_avatar
+from app.db import SessionLocal
+from app.models import User
+from app.redis_client import RedisDB
+from app.settings import settings
+from app.user_cache import invalidate_user
+
+logger = logging.getLogger(__name__)
+
+AVATAR_WORKERS = settings.avatar_workers
+AVATAR_SHUTDOWN_GRACE = 10  # Seconds to finish queued uploads on shutdown
+AVATAR_JOB_EXPIRATION_TIME = 24 * 60 * 60  # 24 hours in seconds
+# The image behind a URL may change, so URLs map to assets for a day only.
+# Image digests map to their asset for good.
+AVATAR_URL_INDEX_TTL = 24 * 60 * 60  # 24 hours in seconds
+
+
+@dataclass
+class AvatarJob:
+    """
+    An avatar upload waiting in the queue.
+    """
+
+    id: str
+    user_id: int
+    email: str
+    url: str
+
+
+def avatar_jobs_db():
+    return RedisDB().select(RedisDB.DBs.AVATAR_JOBS)
+
+
+async def set_job_status(job, status, **fields):
+    """
+    Record the status of an avatar job. Failing to record it must not stop
+    the upload, so errors are only logged.
+
+    Args:
+        job (AvatarJob): The job.
+        status (str): queued, uploading, done or failed.
+        fields: Other fields to record, e.g. the avatar URL or the error.
+    """
+    try:
+        await avatar_jobs_db().hset(
+            job.id, mapping={"status": status, "user_id": job.user_id, **fields}
+        )
+        await avatar_jobs_db().expire(job.id, AVATAR_JOB_EXPIRATION_TIME)
+    except Exception:
+        logger.exception("Could not record the status of avatar job %s", job.id)
+
+
+def avatar_assets_db():
+    return RedisDB().select(RedisDB.DBs.AVATAR_ASSETS)
+
+
+def url_key(url):
+    return "url:" + hashlib.sha256(url.encode()).hexdigest()
+
+
+def digest_key(digest):
+    return "sha256:" + digest
+
+
+async def find_asset(key):
+    """
+    Return the Cloudinary asset indexed under a key, None if there is none.
+    The index only saves uploads, so errors read as misses.
+
+    Args:
+        key (str): The key, from url_key or digest_key.
+    """
+    try:
+        asset = await avatar_assets_db().get(key)
+    except Exception:
+        logger.exception("Could not read the avatar asset index")
+        return None
+    return orjson.loads(asset) if asset is not None else None
+
+
+async def index_asset(asset, key, ex=None):
+    """
+    Index a Cloudinary asset under a key, so later uploads reuse it.
+
+    Args:
+        asset (dict): The asset, from upload_avatar.
+        key (str): The key, from url_key or digest_key.
+        ex (int): Seconds until the key expires, None to keep it.
+    """
+    try:
+        await avatar_assets_db().set(key, orjson.dumps(asset), ex=ex)
+    except Exception:
+        logger.exception("Could not update the avatar asset index")
+
+
+async def get_job_status(job_id):
+    """
+    Return the status record of an avatar job, empty if unknown.
+
+    Args:
+        job_id (str): The id returned by AvatarQueue.enqueue.
+    """
+    return await avatar_jobs_db().hgetall(job_id)
+
+
+class AvatarQueue:
+    """
+    In-process queue of avatar uploads. Worker tasks upload the images to
+    Cloudinary on threads, then store the new avatar and its variants and
+    drop the user from the cache, so requests never wait for Cloudinary.
+    Images uploaded before, from the same URL or with the same bytes, are
+    not uploaded again.
+    """
+
+    def __init__(self):
+        self.sessions = SessionLocal
+        self._queue = None
+        self._workers = []
+
+    async def start(self, workers=AVATAR_WORKERS):
+        """
+        Start the worker tasks.
+
+        Args:
+            workers (int): The number of uploads run at the same time.
+        """
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    async def stop(self):
+        """
+        Give the workers a moment to finish the queued uploads, then stop
+        them. Unfinished jobs stay queued or uploading until they expire.
+        """
+        try:
+            await asyncio.wait_for(self._queue.join(), AVATAR_SHUTDOWN_GRACE)
+        except asyncio.TimeoutError:
+            logger.warning("%d avatar uploads left undone", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self):
+        """
+        Wait until every queued upload has been handled.
+        """
+        await self._queue.join()
+
+    async def enqueue(self, user_id, email, url):
+        """
+        Queue an avatar upload and return its job id.
+
+        Args:
+            user_id (int): The user's id.
+            email (str): The user's email.
+            url (str): The URL of the image to upload.
+        """
+        job = AvatarJob(uuid4().hex, user_id, email, url)
+        await set_job_status(job, "queued")
+        self._queue.put_nowait(job)
+        return job.id
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as error:
+                logger.exception("Avatar upload %s failed", job.id)
+                await set_job_status(job, "failed", error=str(error))
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        await set_job_status(job, "uploading")
+        asset = await find_asset(url_key(job.url))
+        if asset is None:
+            data = await asyncio.to_thread(fetch_image, job.url)
+            digest = hashlib.sha256(data).hexdigest()
+            asset = await find_asset(digest_key(digest))
+            if asset is None:
+                asset = await asyncio.to_thread(upload_avatar, data, digest)
+                await index_asset(asset, digest_key(digest))
+            await index_asset(asset, url_key(job.url), ex=AVATAR_URL_INDEX_TTL)
+        variants = avatar_variants(asset["public_id"], asset["version"])
+        async with self.sessions() as db:
+            user = await db.get(User, job.user_id)
+            user.avatar = asset["secure_url"]
+            user.avatar_variants = variants
+            await db.commit()
+        await invalidate_user(job.email)
+        await set_job_status(
+            job,
+            "done",
+            avatar=asset["secure_url"],
+            **{f"avatar_{name}": url for name, url in variants.items()},
+        )
+
+
+avatar_queue = AvatarQueue()
@@ -1,25 +1,184 @@
-from cloudinary.utils import cloudinary_url
-from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import os
+from functools import lru_cache
+from app.metrics import timed
+from app.settings import settings
+from urllib.parse import urlsplit
+import http.client
+import ipaddress
+import socket
+import urllib.request
 
-load_dotenv()
+AVATAR_MAX_BYTES = settings.avatar_max_bytes
+AVATAR_FETCH_TIMEOUT = 10  # seconds
+# Square sizes in pixels of the avatar variants, delivered by Cloudinary
+AVATAR_VARIANTS = {"small": 64, "medium": 256, "large": 512}
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-    secure=True,
-)
 
+@lru_cache(maxsize=None)
+def configure_cloudinary():
+    """
+    Import and configure the Cloudinary SDK on first use, as it is slow to
+    import, and return its uploader.
+    """
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=settings.cloudinary_cloud_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret,
+        secure=True,
+    )
+    return cloudinary.uploader
+
+
+def is_public_address(address):
+    """
+    Whether an IP address is reachable on the internet, as opposed to
+    loopback, private, link-local (e.g. cloud metadata) or reserved.
+
+    Args:
+        address (str): The IP address.
+    """
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
 
-def upload_image(url):
+
+def connect_public(address, timeout=None, source_address=None):
     """
-    Uploads an image to Cloudinary and returns the secure URL.
+    Open a connection like socket.create_connection, but only to a host
+    whose addresses are all public. The connection goes to the address
+    checked, so the host cannot resolve to another one in between.
 
     Args:
-        url (str): The URL of the image to upload.
+        address (tuple): The host and port.
+        timeout (float): The timeout of the socket, in seconds.
+        source_address (tuple): The local address to bind to.
+    """
+    host, port = address
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not all(is_public_address(sockaddr[0]) for *_, sockaddr in addresses):
+        raise ValueError("The image URL must point to a public address")
+    return socket.create_connection(addresses[0][4][:2], timeout, source_address)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection to public addresses only.
     """
-    result = cloudinary.uploader.upload(url)
-    return result["secure_url"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection to public addresses only.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    """
+    Opens http URLs over PublicHTTPConnection.
+    """
+
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    """
+    Opens https URLs over PublicHTTPSConnection.
+    """
+
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+def public_opener():
+    """
+    Return a URL opener for http(s) URLs on public addresses only. Every
+    redirect is checked the same way, and no proxy or other scheme is
+    used, so a URL cannot reach the services next to the API.
+    """
+    opener = urllib.request.OpenerDirector()
+    for handler in (
+        PublicHTTPHandler(),
+        PublicHTTPSHandler(),
+        urllib.request.HTTPRedirectHandler(),
+        urllib.request.HTTPDefaultErrorHandler(),
+        urllib.request.HTTPErrorProcessor(),
+    ):
+        opener.add_handler(handler)
+    return opener
+
+
+def fetch_image(url):
+    """
+    Download the bytes of an image to upload, from a public address.
+
+    Args:
+        url (str): The http(s) URL of the image.
+    """
+    if urlsplit(url).scheme not in ("http", "https"):
+        raise ValueError("The image URL must be http or https")
+    opener = public_opener()
+    with timed("image_source", "fetch"):
+        with opener.open(url, timeout=AVATAR_FETCH_TIMEOUT) as response:
+            data = response.read(AVATAR_MAX_BYTES + 1)
+    if len(data) > AVATAR_MAX_BYTES:
+        raise ValueError(f"The image is larger than {AVATAR_MAX_BYTES} bytes")
+    return data
+
+
+def upload_avatar(data, digest):
+    """
+    Uploads image bytes to Cloudinary under a public id derived from their
+    digest, so identical images share one asset, and returns the asset.
+
+    Args:
+        data (bytes): The image.
+        digest (str): The SHA-256 hex digest of the image.
+    """
+    uploader = configure_cloudinary()
+    with timed("cloudinary", "upload"):
+        result = uploader.upload(data, public_id=f"avatars/{digest}", overwrite=False)
+    return {
+        "public_id": result["public_id"],
+        "version": result.get("version"),
+        "secure_url": result["secure_url"],
+    }
+
+
+def avatar_variants(public_id, version=None):
+    """
+    Returns the URLs of the avatar variants of an asset, cropped around
+    the face and in the format and quality that suit each browser.
+
+    Args:
+        public_id (str): The public id of the asset.
+        version (int): The version of the asset, to bypass stale CDN copies.
+    """
+    configure_cloudinary()
+    from cloudinary.utils import cloudinary_url
+
+    return {
+        name: cloudinary_url(
+            public_id,
+            width=size,
+            height=size,
+            crop="fill",
+            gravity="face",
+            fetch_format="auto",
+            quality="auto",
+            secure=True,
+            version=version,
+        )[0]
+        for name, size in AVATAR_VARIANTS.items()
+    }
@@ -0,0 +1,146 @@
+from collections import defaultdict
+from fastapi import status
+from sqlalchemy import delete, insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from app.models import Contact, birthday_key
+from app.schemas import ContactCreate, ContactOperationResult
+
+NOT_FOUND = "Contact not found"
+DUPLICATE = "Contact with this email already exists."
+
+
+class BatchConflict(Exception):
+    """
+    Raised when a batch conflicts with contacts changed concurrently.
+    Nothing of it is applied then.
+    """
+
+
+def contact_values(contact: ContactCreate):
+    """
+    Return the column values of a contact for a bulk statement. These
+    bypass the ORM validators, so birthday_key is computed here.
+
+    Args:
+        contact (ContactCreate): The contact.
+    """
+    values = contact.model_dump()
+    values["birthday_key"] = birthday_key(contact.birth_date)
+    return values
+
+
+async def apply_batch(db, user_id, operations):
+    """
+    Apply contact operations in order, as the single-contact endpoints
+    would one after the other, with one bulk statement per kind of
+    operation and one commit. Operations that would fail are skipped and
+    reported, the others are applied. Raises BatchConflict when a
+    concurrent change makes the batch fail.
+
+    Args:
+        db (AsyncSession): The database session
+        user_id (int): The owner of the contacts
+        operations (List[ContactOperation]): The operations
+    """
+    ids = {op.id for op in operations if op.op != "create"}
+    pairs = {
+        (op.contact.email, op.contact.phone_number)
+        for op in operations
+        if op.op != "delete"
+    }
+
+    # The stored pair of every contact the batch touches or collides with
+    pair_of = {}
+    holders = defaultdict(set)  # (email, phone_number) -> ids holding it
+    if ids or pairs:
+        conditions = []
+        if ids:
+            conditions.append(Contact.id.in_(ids))
+        if pairs:
+            conditions.append(tuple_(Contact.email, Contact.phone_number).in_(pairs))
+        result = await db.execute(
+            select(Contact.id, Contact.email, Contact.phone_number).where(
+                Contact.user_id == user_id, or_(*conditions)
+            )
+        )
+        for id, email, phone_number in result:
+            pair_of[id] = (email, phone_number)
+            holders[(email, phone_number)].add(id)
+
+    # Replay the operations on that state to find the ones that fail
+    results, created, updated, deleted = [], [], [], []
+    for index, op in enumerate(operations):
+        if op.op != "delete":
+            pair = (op.contact.email, op.contact.phone_number)
+        if op.op == "create":
+            if holders[pair]:
+                results.append(
+                    ContactOperationResult(
+                        op=op.op, status=status.HTTP_409_CONFLICT, detail=DUPLICATE
+                    )
+                )
+                continue
+            holders[pair].add(-1 - index)  # Placeholder until it has an id
+            created.append((len(results), contact_values(op.contact)))
+            results.append(
+                ContactOperationResult(op=op.op, status=status.HTTP_201_CREATED)
+            )
+        elif op.id not in pair_of:
+            results.append(
+                ContactOperationResult(
+                    op=op.op,
+                    status=status.HTTP_404_NOT_FOUND,
+                    id=op.id,
+                    detail=NOT_FOUND,
+                )
+            )
+        elif op.op == "update" and holders[pair] - {op.id}:
+            results.append(
+                ContactOperationResult(
+                    op=op.op,
+                    status=status.HTTP_409_CONFLICT,
+                    id=op.id,
+                    detail=DUPLICATE,
+                )
+            )
+        else:
+            holders[pair_of[op.id]].discard(op.id)
+            if op.op == "update":
+                pair_of[op.id] = pair
+                holders[pair].add(op.id)
+                updated.append({"id": op.id, **contact_values(op.contact)})
+            else:
+                del pair_of[op.id]
+                deleted.append(op.id)
+            results.append(
+                ContactOperationResult(op=op.op, status=status.HTTP_200_OK, id=op.id)
+            )
+
+    # Deletes and updates first, freeing the pairs that creates may reuse
+    try:
+        if deleted:
+            await db.execute(
+                delete(Contact).where(
+                    Contact.user_id == user_id, Contact.id.in_(deleted)
+                )
+            )
+        # In order, not merged per contact: each update was checked against
+        # the pairs left by the ones before it, so none takes a pair that
+        # is still held, as when two contacts swap theirs through a third
+        gone = set(deleted)
+        updated = [values for values in updated if values["id"] not in gone]
+        if updated:
+            await db.execute(update(Contact), updated)
+        if created:
+            new_ids = await db.scalars(
+                insert(Contact).returning(Contact.id, sort_by_parameter_order=True),
+                [{**values, "user_id": user_id} for _, values in created],
+            )
+            for (position, _), id in zip(created, new_ids):
+                results[position].id = id
+        await db.commit()
+    except IntegrityError:
+        # A contact created or changed concurrently
+        await db.rollback()
+        raise BatchConflict()
+    return results
@@ -0,0 +1,128 @@
+import csv
+import io
+import orjson
+import zlib
+
+from app.models import Contact
+from app.schemas import ContactRead
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_COLUMNS = tuple(ContactRead.model_fields)
+EXPORT_BATCH_SIZE = 1000  # Rows fetched from the cursor and encoded together
+EXPORT_GZIP_LEVEL = 6
+
+
+def parse_columns(columns):
+    """
+    Return the export columns named in a comma separated list, all of them
+    if it is empty. Raises ValueError on an unknown column.
+
+    Args:
+        columns (str): The column names, e.g. "first_name,email".
+    """
+    if not columns:
+        return EXPORT_COLUMNS
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXPORT_COLUMNS]
+    if unknown or not names:
+        raise ValueError(
+            f"Unknown columns: {', '.join(unknown)}. "
+            f"Choose from: {', '.join(EXPORT_COLUMNS)}."
+        )
+    return tuple(dict.fromkeys(names))
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header accepts gzip: gzip, or else "*",
+    is listed with a quality above 0.
+
+    Args:
+        accept_encoding (str): The header value, e.g. "gzip;q=0.8, br".
+    """
+    qualities = {}
+    for coding in (accept_encoding or "").split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def encode_csv(columns, rows, header=False):
+    """
+    Encode rows as CSV.
+
+    Args:
+        columns (tuple): The column names.
+        rows (List[tuple]): The rows.
+        header (bool): Whether to start with the header row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def encode_ndjson(columns, rows, header=False):
+    """
+    Encode rows as NDJSON, one object per row.
+
+    Args:
+        columns (tuple): The column names.
+        rows (List[tuple]): The rows.
+        header (bool): Unused, NDJSON has no header.
+    """
+    return b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+async def export_contacts(db, contacts, columns, format, gzip=False):
+    """
+    Yield the export of a user's contacts in chunks, read in batches from a
+    server-side cursor so memory use does not depend on the number of
+    contacts. Every batch is a round trip to the database, which lets other
+    requests run in between.
+
+    Args:
+        db (AsyncSession): The database session
+        contacts (Select): The contacts of the user, from get_user_contacts
+        columns (tuple): The columns to export, from parse_columns
+        format (str): csv or ndjson
+        gzip (bool): Whether to gzip the output on the fly
+    """
+    encode = encode_csv if format == "csv" else encode_ndjson
+    query = (
+        contacts.with_only_columns(*(getattr(Contact, name) for name in columns))
+        .order_by(Contact.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, wbits=31) if gzip else None
+    header = True
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        chunk = encode(columns, rows, header)
+        header = False
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if header:  # No contacts, still send the CSV header
+        chunk = encode(columns, [], header)
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        yield chunk
+    if compressor is not None:
+        yield compressor.flush()
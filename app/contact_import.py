@@ -0,0 +1,302 @@
+import asyncio
+import codecs
+import csv
+import orjson
+
+from pydantic import ValidationError
+from sqlalchemy import select, tuple_
+from app.db import dialect_insert
+from app.models import Contact, birthday_key
+from app.schemas import ContactCreate
+
+IMPORT_FORMATS = ("csv", "ndjson")
+DUPLICATE = "Contact with this email already exists."
+IMPORT_CHUNK_SIZE = 5000  # Rows validated and loaded together
+IMPORT_MAX_ERRORS = 1000  # Rows reported in detail, the rest are only counted
+# A quoted CSV value still open past this many characters is cut short, so
+# a stray quote cannot pull the rest of the upload into one record
+IMPORT_MAX_RECORD_SIZE = 64 * 1024
+IMPORT_COLUMNS = (
+    "first_name",
+    "last_name",
+    "email",
+    "phone_number",
+    "birth_date",
+    "birthday_key",
+    "additional_info",
+    "user_id",
+)
+_OPTIONAL_FIELDS = [
+    name
+    for name, field in ContactCreate.model_fields.items()
+    if not field.is_required()
+]
+
+
+async def iter_records(chunks, quoted=True):
+    """
+    Split an uploaded byte stream into text records, one per line. With
+    quoted, quoted CSV values that span several lines are kept together,
+    up to IMPORT_MAX_RECORD_SIZE characters.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The request body.
+        quoted (bool): Whether records are CSV; NDJSON has one per line.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    record, quotes, tail = "", 0, ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        *lines, tail = text.split("\n")
+        for line in lines:
+            line += "\n"
+            record += line
+            if quoted:
+                quotes += line.count('"')
+            # Not inside a quoted value, or in one that never closes
+            if quotes % 2 == 0 or len(record) > IMPORT_MAX_RECORD_SIZE:
+                yield record
+                record, quotes = "", 0
+    record += tail + decoder.decode(b"", final=True)
+    if record:
+        yield record
+
+
+def read_csv_record(record):
+    """
+    Return the values of every row of a CSV record. A record whose lines
+    were joined by a stray quote in an unquoted value does not parse, so
+    its lines are read one by one instead; for a line that still does not
+    parse the error is returned instead of its values.
+
+    Args:
+        record (str): A record from iter_records.
+    """
+    try:
+        return [next(csv.reader([record]), [])]
+    except csv.Error:
+        pass
+    rows = []
+    for line in record.split("\n"):
+        try:
+            rows.append(next(csv.reader([line]), []))
+        except csv.Error as error:
+            rows.append(f"row: invalid CSV, {error}")
+    return rows
+
+
+async def parse_csv(records):
+    """
+    Yield the rows of a CSV upload as dicts keyed by its header. For a
+    row that is not valid CSV the parse error is yielded instead, and
+    reported for that row.
+
+    Args:
+        records (AsyncIterator[str]): The records from iter_records.
+    """
+    header = None
+    async for record in records:
+        for values in read_csv_record(record):
+            if isinstance(values, str):
+                yield values  # The parse error
+            elif not values:
+                continue
+            elif header is None:
+                header = [name.strip() for name in values]
+            else:
+                row = dict(zip(header, values))
+                for name in _OPTIONAL_FIELDS:
+                    if row.get(name) == "":
+                        row[name] = None
+                yield row
+
+
+async def parse_ndjson(records):
+    """
+    Yield the rows of an NDJSON upload. For a line that is not valid JSON
+    the parse error is yielded instead, and reported for that row.
+
+    Args:
+        records (AsyncIterator[str]): The records from iter_records.
+    """
+    async for record in records:
+        if not record.strip():
+            continue
+        try:
+            yield orjson.loads(record)
+        except orjson.JSONDecodeError as error:
+            yield f"row: invalid JSON, {error}"
+
+
+def validate_rows(chunk):
+    """
+    Validate numbered rows against ContactCreate. Returns the valid
+    contacts and the (row number, errors) of the invalid rows.
+
+    Args:
+        chunk (List[tuple]): (row number, row) pairs.
+    """
+    valid, invalid = [], []
+    for row_number, row in chunk:
+        if not isinstance(row, dict):
+            # The parsers yield the parse error of a malformed row
+            error = row if isinstance(row, str) else "row: expected an object"
+            invalid.append((row_number, [error]))
+            continue
+        try:
+            contact = ContactCreate.model_validate(row)
+        except ValidationError as error:
+            invalid.append(
+                (
+                    row_number,
+                    [
+                        f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}"
+                        for e in error.errors(include_url=False)
+                    ],
+                )
+            )
+            continue
+        valid.append((row_number, contact))
+    return valid, invalid
+
+
+class ContactImport:
+    """
+    Validates uploaded contact rows in chunks and loads the valid ones in
+    bulk: COPY on PostgreSQL, a multi-row INSERT elsewhere. Rows that are
+    invalid or duplicate an existing contact (same email and phone number)
+    are skipped and reported.
+    """
+
+    def __init__(self, db, user_id):
+        self.db = db
+        self.user_id = user_id
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self._seen = set()  # (email, phone_number) of this upload
+
+    async def run(self, rows):
+        """
+        Import the rows and return the report.
+
+        Args:
+            rows (AsyncIterator[dict]): The parsed rows.
+        """
+        chunk = []
+        row_number = 0
+        async for row in rows:
+            row_number += 1
+            chunk.append((row_number, row))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await self._load(chunk)
+                chunk = []
+        if chunk:
+            await self._load(chunk)
+        return self.report()
+
+    def report(self):
+        """
+        Return the number of imported and failed rows, with the errors of
+        the first IMPORT_MAX_ERRORS failed rows.
+        """
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+    def _reject(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    async def _existing(self, contacts):
+        pairs = {(contact.email, contact.phone_number) for _, contact in contacts}
+        if not pairs:
+            return set()
+        result = await self.db.execute(
+            select(Contact.email, Contact.phone_number).where(
+                Contact.user_id == self.user_id,
+                tuple_(Contact.email, Contact.phone_number).in_(pairs),
+            )
+        )
+        return {tuple(row) for row in result}
+
+    async def _load(self, chunk):
+        # Email validation is CPU heavy, keep it off the event loop
+        contacts, invalid = await asyncio.to_thread(validate_rows, chunk)
+        for row_number, errors in invalid:
+            self._reject(row_number, errors)
+        existing = await self._existing(contacts)
+        records, loaded = [], []
+        for row_number, contact in contacts:
+            pair = (contact.email, contact.phone_number)
+            if pair in existing or pair in self._seen:
+                self._reject(row_number, [DUPLICATE])
+                continue
+            self._seen.add(pair)
+            loaded.append((row_number, pair))
+            records.append(
+                (
+                    contact.first_name,
+                    contact.last_name,
+                    contact.email,
+                    contact.phone_number,
+                    contact.birth_date,
+                    birthday_key(contact.birth_date),
+                    contact.additional_info,
+                    self.user_id,
+                )
+            )
+        if records:
+            inserted = await copy_contacts(self.db, records)
+            await self.db.commit()
+            # Created concurrently since the check above
+            for row_number, pair in loaded:
+                if pair not in inserted:
+                    self._reject(row_number, [DUPLICATE])
+            self.imported += len(inserted)
+
+
+async def copy_contacts(db, records):
+    """
+    Bulk insert contact records, with COPY when the driver is asyncpg,
+    skipping those that duplicate a contact (same user, email and phone
+    number). Returns the (email, phone_number) of the inserted records.
+
+    Args:
+        db (AsyncSession): The database session, inside a transaction.
+        records (List[tuple]): The rows, in IMPORT_COLUMNS order.
+    """
+    connection = await db.connection()
+    if connection.dialect.driver == "asyncpg":
+        from asyncpg import UniqueViolationError
+
+        raw = await connection.get_raw_connection()
+        try:
+            await raw.driver_connection.copy_records_to_table(
+                Contact.__tablename__, records=records, columns=IMPORT_COLUMNS
+            )
+            return {(record[2], record[3]) for record in records}
+        except UniqueViolationError:
+            # COPY cannot skip rows: insert the chunk again, skipping conflicts
+            await db.rollback()
+    return await insert_contacts(db, records)
+
+
+async def insert_contacts(db, records):
+    """
+    Insert contact records in one INSERT ... ON CONFLICT DO NOTHING, so
+    a duplicate created concurrently is skipped rather than failing the
+    chunk. Returns the (email, phone_number) of the inserted records.
+
+    Args:
+        db (AsyncSession): The database session, inside a transaction.
+        records (List[tuple]): The rows, in IMPORT_COLUMNS order.
+    """
+    result = await db.execute(
+        dialect_insert(db, Contact)
+        .on_conflict_do_nothing(
+            index_elements=[Contact.user_id, Contact.email, Contact.phone_number]
+        )
+        .returning(Contact.email, Contact.phone_number),
+        [dict(zip(IMPORT_COLUMNS, record)) for record in records],
+    )
+    return {tuple(row) for row in result}
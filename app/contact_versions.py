@@ -0,0 +1,72 @@
+import hashlib
+import time
+
+from app.redis_client import RedisDB
+
+
+def contacts_versions_db():
+    return RedisDB().select(RedisDB.DBs.CONTACTS_VERSIONS)
+
+
+async def get_contacts_version(user_id: int) -> str:
+    """
+    Return the version of a user's contacts, which changes whenever one of
+    them does.
+
+    Args:
+        user_id (int): The user's id.
+    """
+    key = str(user_id)
+    version = await contacts_versions_db().get(key)
+    if version is None:
+        # Start from the clock, not 0, so versions handed out before Redis
+        # lost the key are never handed out again
+        await contacts_versions_db().set(key, time.time_ns(), nx=True)
+        version = await contacts_versions_db().get(key)
+    return str(version)
+
+
+async def bump_contacts_version(user_id: int):
+    """
+    Move a user's contacts to a new version. Call it after committing any
+    change to them.
+
+    Args:
+        user_id (int): The user's id.
+    """
+    key = str(user_id)
+    async with contacts_versions_db().client.pipeline(transaction=False) as pipe:
+        pipe.set(contacts_versions_db().key(key), time.time_ns(), nx=True)
+        pipe.incr(contacts_versions_db().key(key))
+        await pipe.execute()
+
+
+def make_etag(version: str, *parts) -> str:
+    """
+    Return the weak ETag of a response derived from a contacts version and
+    whatever else the response depends on, e.g. the query parameters.
+
+    Args:
+        version (str): The contacts version.
+        parts: The other inputs of the response.
+    """
+    digest = hashlib.sha256("\n".join(map(str, parts)).encode()).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """
+    Whether an If-None-Match header matches an ETag, comparing weakly.
+
+    Args:
+        etag (str): The current ETag.
+        if_none_match (str): The header value, a list of ETags or "*".
+    """
+    if not if_none_match:
+        return False
+    etag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
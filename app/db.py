@@ -1,24 +1,295 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from sqlalchemy import event, exc
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.metrics import Histogram, Metric, dependency_seconds
+from app.settings import settings
+import logging
+import re
+import time
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL = settings.database_url
+# Statements prepared per asyncpg connection and reused on later calls
+DB_STATEMENT_CACHE_SIZE = settings.db_statement_cache_size
+# Connection pool, per worker process
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout  # seconds
+DB_POOL_RECYCLE = settings.db_pool_recycle  # seconds, -1 never
+DB_POOL_PRE_PING = settings.db_pool_pre_ping
+# Statements slower than this are logged, with their normalized SQL
+DB_SLOW_QUERY_MS = settings.db_slow_query_ms
+# In debug mode, responses tell how many statements they took
+DB_QUERY_HEADERS = settings.debug
 
-# Create SQLAlchemy engine and sessionmaker
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async drivers replacing the sync ones of DATABASE_URL, which alembic uses
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url):
+    """
+    Return the given database URL with its driver replaced by the async one.
+
+    Args:
+        url (str): The database URL, e.g. postgresql://user:pass@db/contacts
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return url
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == "postgresql":
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)}
+        )
+    return url
+
+
+# Time spent waiting for a pooled connection, and checkouts that gave up
+pool_checkout_wait = Metric(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection.",
+    Histogram,
+).labels()
+pool_checkout_timeouts = 0
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool recording how long every checkout waits for a connection.
+    """
+
+    def connect(self):
+        global pool_checkout_timeouts
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_checkout_timeouts += 1
+            raise
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+
+def engine_options(url):
+    """
+    Return the engine options for a database URL. Pool settings only apply
+    to server databases; SQLite keeps the pool SQLAlchemy picks for it.
+
+    Args:
+        url (URL): The database URL
+    """
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": InstrumentedPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+@dataclass
+class QueryStats:
+    """
+    The SQL statements run on behalf of a request, and their total time.
+    """
+
+    count: int = 0
+    seconds: float = 0.0
+
+
+current_queries = ContextVar("current_queries", default=None)
+
+
+@contextmanager
+def profile_queries():
+    """
+    Count the statements run by the current task, and the tasks it starts,
+    until the block exits.
+    """
+    stats = QueryStats()
+    token = current_queries.set(stats)
+    try:
+        yield stats
+    finally:
+        current_queries.reset(token)
+
+
+# Lists of placeholders, e.g. of IN or VALUES: (?, ?, ?) or ($1, $2, $3)
+IN_LIST = re.compile(r"\((?:\?|\$\d+|%s)(?:, (?:\?|\$\d+|%s))+\)")
+
+
+def normalize_sql(statement):
+    """
+    Return a statement on one line, with its lists of placeholders
+    collapsed, so a query reads the same whatever the number of values.
+
+    Args:
+        statement (str): The SQL statement.
+    """
+    return IN_LIST.sub("(...)", " ".join(statement.split()))
+
+
+def bind_shape(parameters, executemany=False):
+    """
+    Describe the parameters of a statement by type, without their values.
+
+    Args:
+        parameters: The parameters, or their list for executemany.
+        executemany (bool): Whether the statement ran once per parameter set.
+    """
+    if executemany:
+        return f"{len(parameters)} x {bind_shape(parameters[0])}" if parameters else ""
+    if isinstance(parameters, dict):
+        types = (f"{name}: {type(v).__name__}" for name, v in parameters.items())
+        return "{" + ", ".join(types) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in parameters or ()) + ")"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def end_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_started
+    stats = current_queries.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+    if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s %s",
+            elapsed * 1000,
+            normalize_sql(statement),
+            bind_shape(parameters, executemany),
+        )
+
+
+class QueryProfilerMiddleware:
+    """
+    ASGI middleware profiling the SQL statements of every request. In
+    debug mode their count and total time go in the X-DB-Query-Count and
+    X-DB-Query-Time headers; statements a streamed response runs after its
+    headers are sent are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries() as stats:
+
+            async def send_stats(message):
+                if message["type"] == "http.response.start" and DB_QUERY_HEADERS:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-db-query-count", str(stats.count).encode()),
+                        (b"x-db-query-time", f"{stats.seconds * 1000:.1f}ms".encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_stats)
+
+
+# INSERT constructs supporting ON CONFLICT, per dialect
+DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def dialect_insert(db, entity):
+    """
+    Return an INSERT into an entity for the session's database, with its
+    ON CONFLICT clauses available.
+
+    Args:
+        db (AsyncSession): The database session
+        entity: The mapped class or table to insert into
+    """
+    return DIALECT_INSERTS[db.get_bind().dialect.name](entity)
+
+
+def pool_status():
+    """
+    Return the state of the connection pool and its checkout statistics.
+    """
+    pool = init_engine().pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, InstrumentedPool):
+        status.update(
+            checkout_wait_seconds=pool_checkout_wait.snapshot(),
+            checkout_timeouts=pool_checkout_timeouts,
+        )
+    return status
+
+
+# The engine is created on first use, as creating it imports the driver.
+# SessionLocal is bound to it then.
+engine = None
+SessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def init_engine():
+    """
+    Create the engine of DATABASE_URL if not done yet, and return it.
+    """
+    global engine
+    if engine is None:
+        engine_url = async_database_url(DATABASE_URL)
+        engine = create_async_engine(engine_url, **engine_options(engine_url))
+        SessionLocal.configure(bind=engine)
+    return engine
+
+
+async def dispose_engine():
+    """
+    Close the pooled connections of the engine and forget it.
+    """
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
 
 
 # Dependency to get the DB session
-def get_db():
+async def get_db():
     """
     Returns a database postgres session.
     """
+    init_engine()
     db = SessionLocal()
+    started = time.perf_counter()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+        # The request holds the session, and its connection, this long
+        dependency_seconds.labels("db", "session").observe(
+            time.perf_counter() - started
+        )
@@ -1,34 +1,298 @@
-import os
+import asyncio
+import logging
 import smtplib
+import time
 
-from dotenv import load_dotenv
+from dataclasses import dataclass
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from uuid import uuid4
+from app.metrics import timed
+from app.redis_client import RedisDB
+from app.settings import settings
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
+SMTP_HOST = settings.smtp_host
+SMTP_PORT = settings.smtp_port
+SMTP_STARTTLS = settings.smtp_starttls
+SMTP_TIMEOUT = settings.smtp_timeout  # seconds
+SMTP_USER = settings.env_email  # Also the sender of the emails
+SMTP_PASSWORD = settings.env_email_password  # Unset to send without login
+SMTP_IDLE_TIMEOUT = 60  # Reconnect instead of reusing a connection idle longer
+EMAIL_WORKERS = settings.email_workers
+EMAIL_BATCH_SIZE = settings.email_batch_size
+EMAIL_MAX_ATTEMPTS = settings.email_max_attempts
+EMAIL_RETRY_BACKOFF = settings.email_retry_backoff  # seconds
+EMAIL_SHUTDOWN_GRACE = 10  # Seconds to flush the queue on shutdown
+EMAIL_STATUS_EXPIRATION_TIME = 7 * 24 * 60 * 60  # 7 days in seconds
 
-def send_email(receiver_email, subject, body):
+
+def build_message(sender_email, receiver_email, subject, body):
     """
-    Send an email using Gmail's SMTP server.
+    Build a plain text email.
 
     Args:
+        sender_email (str): The sender's email address.
         receiver_email (str): The recipient's email address.
         subject (str): The subject of the email.
         body (str): The body of the email.
     """
-    sender_email = os.getenv("ENV_EMAIL")
-    sender_password = os.getenv("ENV_EMAIL_PASSWORD")
-    print(f"email: {sender_email}")
-    print(f"password: {sender_password}")
     msg = MIMEMultipart()
     msg["From"] = sender_email
     msg["To"] = receiver_email
     msg["Subject"] = subject
     msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+class SMTPConnection:
+    """
+    Authenticated SMTP connection kept open between sends. Blocking, so
+    it is only used from worker threads.
+    """
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        self._server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            self._server.starttls()  # Upgrade connection to secure
+        if SMTP_PASSWORD:
+            self._server.login(SMTP_USER, SMTP_PASSWORD)
+
+    def send(self, msg):
+        """
+        Send an email, connecting first if needed. A connection the server
+        dropped is replaced once.
+
+        Args:
+            msg (MIMEMultipart): The email to send.
+        """
+        if time.monotonic() - self._last_used > SMTP_IDLE_TIMEOUT:
+            self.close()
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connect()
+            self._server.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        """
+        Close the connection, if open.
+        """
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+
+
+def is_transient(error):
+    """
+    Whether a failed send may succeed later: on 4xx replies, dropped
+    connections and network errors, not on 5xx replies.
+
+    Args:
+        error (Exception): The error of the send.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    elif isinstance(error, smtplib.SMTPResponseException):
+        codes = [error.smtp_code]
+    else:
+        # Other SMTPExceptions, e.g. a missing extension, are permanent
+        return isinstance(error, smtplib.SMTPServerDisconnected) or not isinstance(
+            error, smtplib.SMTPException
+        )
+    return all(400 <= code < 500 for code in codes)
+
+
+@dataclass
+class Delivery:
+    """
+    An email waiting in the delivery queue.
+    """
+
+    id: str
+    receiver_email: str
+    subject: str
+    body: str
+    attempts: int = 0
+
+
+def deliveries_db():
+    return RedisDB().select(RedisDB.DBs.EMAIL_DELIVERIES)
+
+
+async def set_delivery_status(delivery, status, error=""):
+    """
+    Record the delivery status of an email. Failing to record it must not
+    stop the delivery, so errors are only logged.
+
+    Args:
+        delivery (Delivery): The email.
+        status (str): queued, retrying, sent or failed.
+        error (str): The last delivery error, if any.
+    """
+    try:
+        await deliveries_db().hset(
+            delivery.id,
+            mapping={
+                "status": status,
+                "attempts": delivery.attempts,
+                "error": error,
+            },
+        )
+        await deliveries_db().expire(delivery.id, EMAIL_STATUS_EXPIRATION_TIME)
+    except Exception:
+        logger.exception("Could not record the status of email %s", delivery.id)
+
 
-    server = smtplib.SMTP("smtp.gmail.com", 587)
-    server.starttls()  # Upgrade connection to secure
-    server.login(sender_email, sender_password)
-    server.sendmail(sender_email, receiver_email, msg.as_string())
-    server.quit()
+async def get_delivery_status(delivery_id):
+    """
+    Return the delivery status record of an email, empty if unknown.
+
+    Args:
+        delivery_id (str): The id returned by send_email.
+    """
+    return await deliveries_db().hgetall(delivery_id)
+
+
+class EmailQueue:
+    """
+    In-process queue of outgoing emails. Worker tasks send them in batches,
+    each over its own long-lived SMTP connection, and retry transiently
+    failed sends with exponential backoff.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._workers = []
+        self._retries = {}  # Delivery id -> (delivery, timer) awaiting backoff
+        self._stopping = False
+
+    async def start(self, workers=EMAIL_WORKERS):
+        """
+        Start the worker tasks.
+
+        Args:
+            workers (int): The number of workers, i.e. of SMTP connections.
+        """
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    async def stop(self):
+        """
+        Give the workers a moment to flush the queue, then stop them.
+        Retries waiting for their backoff are queued right away, and sends
+        failing meanwhile are not retried.
+        """
+        self._stopping = True
+        for delivery_id in list(self._retries):
+            self._retry(delivery_id)
+        try:
+            await asyncio.wait_for(self._queue.join(), EMAIL_SHUTDOWN_GRACE)
+        except asyncio.TimeoutError:
+            logger.warning("%d emails left unsent", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self):
+        """
+        Wait until every queued email has been handled.
+        """
+        await self._queue.join()
+
+    async def enqueue(self, receiver_email, subject, body):
+        """
+        Queue an email and return its delivery id.
+
+        Args:
+            receiver_email (str): The recipient's email address.
+            subject (str): The subject of the email.
+            body (str): The body of the email.
+        """
+        delivery = Delivery(uuid4().hex, receiver_email, subject, body)
+        await set_delivery_status(delivery, "queued")
+        self._queue.put_nowait(delivery)
+        return delivery.id
+
+    async def _work(self):
+        connection = SMTPConnection()
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < EMAIL_BATCH_SIZE and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                errors = await asyncio.to_thread(self._send_batch, connection, batch)
+                for delivery, error in zip(batch, errors):
+                    await self._record(delivery, error)
+                    self._queue.task_done()
+        finally:
+            await asyncio.to_thread(connection.close)
+
+    @staticmethod
+    def _send_batch(connection, batch):
+        errors = []
+        for delivery in batch:
+            msg = build_message(
+                SMTP_USER, delivery.receiver_email, delivery.subject, delivery.body
+            )
+            try:
+                with timed("smtp", "send"):
+                    connection.send(msg)
+                errors.append(None)
+            except (smtplib.SMTPException, OSError) as error:
+                connection.close()
+                errors.append(error)
+        return errors
+
+    async def _record(self, delivery, error):
+        delivery.attempts += 1
+        if error is None:
+            await set_delivery_status(delivery, "sent")
+        elif (
+            not is_transient(error)
+            or delivery.attempts >= EMAIL_MAX_ATTEMPTS
+            or self._stopping
+        ):
+            logger.error("Giving up on email %s: %s", delivery.id, error)
+            await set_delivery_status(delivery, "failed", str(error))
+        else:
+            await set_delivery_status(delivery, "retrying", str(error))
+            backoff = EMAIL_RETRY_BACKOFF * 2 ** (delivery.attempts - 1)
+            timer = asyncio.get_running_loop().call_later(
+                backoff, self._retry, delivery.id
+            )
+            self._retries[delivery.id] = (delivery, timer)
+
+    def _retry(self, delivery_id):
+        delivery, timer = self._retries.pop(delivery_id)
+        timer.cancel()  # When queued before its backoff is over
+        self._queue.put_nowait(delivery)
+
+
+email_queue = EmailQueue()
+
+
+async def send_email(receiver_email, subject, body):
+    """
+    Queue an email for background delivery and return its delivery id.
+
+    Args:
+        receiver_email (str): The recipient's email address.
+        subject (str): The subject of the email.
+        body (str): The body of the email.
+    """
+    return await email_queue.enqueue(receiver_email, subject, body)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from app.metrics import Histogram, dependency_seconds
+from app.settings import settings
+
+# bcrypt releases the GIL, so threads hash in parallel
+HASH_WORKERS = settings.hash_workers
+HASH_QUEUE_SIZE = settings.hash_queue_size  # Waiting for a worker
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """
+    Return the password hashing context, created on first use as passlib
+    is slow to import.
+    """
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingSaturated(Exception):
+    """
+    Raised when the password hasher has no room for more work.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs password hashing on a dedicated thread pool, so bursts of logins
+    cannot take the threads and event loop time other requests need.
+    Work beyond the workers and the bounded wait queue is rejected
+    straight away with HashingSaturated.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0  # Running plus waiting
+        self.rejected = 0
+        self.hash_seconds = Histogram()
+        self.queue_wait_seconds = Histogram()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="hashing")
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password.
+
+        Args:
+            password (str): The password to hash.
+        """
+        return await self._run(get_pwd_context().hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Check a password against its hash.
+
+        Args:
+            password (str): The password to check.
+            hashed_password (str): The stored hash.
+        """
+        return await self._run(get_pwd_context().verify, password, hashed_password)
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HashingSaturated()
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        timings = []
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timings.append((started - submitted, time.perf_counter() - started))
+
+        self.in_flight += 1
+        future = self._executor.submit(timed)
+        # Counted until the thread is done, even if the request is cancelled
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._done))
+        result = await asyncio.wrap_future(future)
+        queue_wait, duration = timings[0]
+        self.queue_wait_seconds.observe(queue_wait)
+        self.hash_seconds.observe(duration)
+        dependency_seconds.labels("bcrypt", func.__name__).observe(duration)
+        return result
+
+    def _done(self):
+        self.in_flight -= 1
+
+    def status(self):
+        """
+        Return the hasher load and latency statistics.
+        """
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "rejected": self.rejected,
+            "hash_seconds": self.hash_seconds.snapshot(),
+            "queue_wait_seconds": self.queue_wait_seconds.snapshot(),
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,72 @@
+import time
+
+from collections import OrderedDict
+
+
+class LocalCache:
+    """
+    Bounded in-process cache. Entries expire after their TTL and the least
+    recently used entry is evicted when the cache is full. Not shared
+    between worker processes, and not thread-safe: use it from the event
+    loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under a key, or default if there is none.
+
+        Args:
+            key: The key.
+            default: The value to return on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None, expires_at: float = None):
+        """
+        Cache a value.
+
+        Args:
+            key: The key.
+            value: The value.
+            ttl (float): Seconds to keep the value, instead of the default.
+            expires_at (float): time.monotonic() deadline, instead of a TTL.
+        """
+        if expires_at is None:
+            expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove a key and return its value, or default if it is not cached.
+
+        Args:
+            key: The key.
+            default: The value to return if the key is not cached.
+        """
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
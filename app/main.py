@@ -1,10 +1,44 @@
-from fastapi import FastAPI
+import asyncio
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from app.api import router as contact_router, limiter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api import router as contact_router
+from app.avatar_jobs import avatar_queue
+from app.cloudinary_utils import configure_cloudinary
+from app.db import QueryProfilerMiddleware, dispose_engine, init_engine, pool_status
+from app.email_utils import email_queue
+from app.hashing import HashingSaturated, get_pwd_context, password_hasher
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+from app.rate_limit import rate_limiter
+from app.redis_client import RedisDB
+from app.response_cache import response_cache
+from app.user_cache import listen_for_invalidations
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the clients before the first request instead of on import
+    init_engine()
+    RedisDB()
+    configure_cloudinary()
+    get_pwd_context()
+    await email_queue.start()
+    await avatar_queue.start()
+    invalidations = asyncio.create_task(listen_for_invalidations())
+    yield
+    # Bounded: asyncio.wait_for in Python 3.11 can swallow a cancellation
+    invalidations.cancel()
+    await asyncio.wait([invalidations], timeout=1)
+    await email_queue.stop()
+    await avatar_queue.stop()
+    # Release the pooled connections on shutdown
+    await RedisDB().close()
+    await dispose_engine()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 origins = ["<http://localhost:3000>"]
 app.add_middleware(
     CORSMiddleware,
@@ -13,8 +47,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_middleware(QueryProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+# Shed password hashing load instead of queueing requests indefinitely
+@app.exception_handler(HashingSaturated)
+async def hashing_saturated_handler(request: Request, exc: HashingSaturated):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many password operations, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 
 # Include the API routes
@@ -25,3 +69,30 @@ app.include_router(contact_router)
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Contact API!"}
+
+
+# Instrumentation, used to size the pools per worker count
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    # Prometheus text format; like the other metrics, per worker process
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/metrics/db-pool")
+async def read_db_pool_metrics():
+    return pool_status()
+
+
+@app.get("/metrics/hashing")
+async def read_hashing_metrics():
+    return password_hasher.status()
+
+
+@app.get("/metrics/cache")
+async def read_cache_metrics():
+    return response_cache.status()
+
+
+@app.get("/metrics/rate-limits")
+async def read_rate_limit_metrics():
+    return rate_limiter.status()
@@ -0,0 +1,255 @@
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Default latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    Histogram of observed values with cumulative buckets, in the style of
+    Prometheus: every bucket counts the observations less than or equal
+    to its upper bound.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()  # Observed from worker threads too
+
+    def observe(self, value):
+        """
+        Record an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    def snapshot(self):
+        """
+        Return the histogram as a JSON-serializable dict.
+        """
+        return {
+            "buckets": {
+                "+Inf" if math.isinf(bound) else str(bound): count
+                for bound, count in zip(self.buckets, self.counts)
+            },
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+    def samples(self):
+        for bound, count in zip(self.buckets, self.counts):
+            yield "_bucket", {"le": "+Inf" if math.isinf(bound) else str(bound)}, count
+        yield "_sum", {}, self.sum
+        yield "_count", {}, self.count
+
+
+class Counter:
+    """
+    Count that only goes up, e.g. of requests.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield "", {}, self.value
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, e.g. of requests in progress.
+    """
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+# Every labelled metric, in the order /metrics lists them
+REGISTRY = []
+
+
+class Metric:
+    """
+    A named metric with one child per combination of label values, e.g.
+    request counts per route and status, exposed in the Prometheus text
+    format. Children are created on first use.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """
+        Return the child of a combination of label values.
+
+        Args:
+            values (str): The label values, in the order of labelnames.
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self.kind())
+        return child
+
+    def render(self):
+        """
+        Return the metric in the Prometheus text format.
+        """
+        kind = {Histogram: "histogram", Counter: "counter", Gauge: "gauge"}
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {kind[self.kind]}",
+        ]
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            for suffix, extra, value in child.samples():
+                lines.append(
+                    f"{self.name}{suffix}{format_labels({**labels, **extra})} {value}"
+                )
+        return "\n".join(lines)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render_metrics():
+    """
+    Return every metric of this worker in the Prometheus text format.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+http_requests = Metric(
+    "http_requests_total",
+    "HTTP responses by route and status.",
+    Counter,
+    ("method", "route", "status"),
+)
+http_request_seconds = Metric(
+    "http_request_duration_seconds",
+    "Time from the request to the end of its response body.",
+    Histogram,
+    ("method", "route"),
+)
+http_requests_in_progress = Metric(
+    "http_requests_in_progress",
+    "HTTP requests being handled.",
+    Gauge,
+    ("method",),
+)
+dependency_seconds = Metric(
+    "dependency_duration_seconds",
+    "Time spent in calls to the database, Redis, SMTP, Cloudinary and bcrypt.",
+    Histogram,
+    ("dependency", "operation"),
+)
+dependency_errors = Metric(
+    "dependency_errors_total",
+    "Calls to the dependencies that raised.",
+    Counter,
+    ("dependency", "operation"),
+)
+
+
+@contextmanager
+def timed(dependency, operation):
+    """
+    Time a call to a dependency and count it as an error if it raises.
+
+    Args:
+        dependency (str): The dependency, e.g. "redis".
+        operation (str): The operation, e.g. "get".
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        dependency_errors.labels(dependency, operation).inc()
+        raise
+    finally:
+        dependency_seconds.labels(dependency, operation).observe(
+            time.perf_counter() - started
+        )
+
+
+def route_name(scope):
+    """
+    Return the path template of the route that served a request, e.g.
+    /contacts/{contact_id}, so metrics are not labelled per contact id.
+    Routing records the route in the scope.
+
+    Args:
+        scope (dict): The ASGI scope of the request.
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status of the HTTP requests
+    per route, and the requests in progress per method, as the route is
+    only known once routed. Pure ASGI, so streamed responses are timed to
+    their last chunk and not buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = 500  # If the app fails before responding
+        in_progress = http_requests_in_progress.labels(method)
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            in_progress.dec()
+            route = route_name(scope)
+            http_request_seconds.labels(method, route).observe(
+                time.perf_counter() - started
+            )
+            http_requests.labels(method, route, str(status)).inc()
@@ -1,15 +1,59 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import (
+    Column,
+    Integer,
+    SmallInteger,
+    String,
+    Date,
+    ForeignKey,
+    Index,
+    JSON,
+)
+from sqlalchemy.orm import declarative_base, validates
 
 Base = declarative_base()
 
 
+def birthday_key(birth_date):
+    """
+    Return the month and day of a date as an MMDD number, e.g. 1231 for
+    December 31st. Ordering these numbers orders dates within a year.
+
+    Args:
+        birth_date (date): The date.
+    """
+    return birth_date.month * 100 + birth_date.day
+
+
 class Contact(Base):
     """
     Contact model representing a contact in the database.
     """
 
     __tablename__ = "contacts"
+    __table_args__ = (
+        # Serves the keyset pagination of a user's contacts
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        # A user has one contact per email and phone number
+        Index(
+            "ix_contacts_user_id_email_phone_number",
+            "user_id",
+            "email",
+            "phone_number",
+            unique=True,
+        ),
+        # Serves the upcoming birthdays range scan
+        Index("ix_contacts_user_id_birthday_key", "user_id", "birthday_key"),
+        # pg_trgm indexes serving the substring search, see app/search.py
+        *(
+            Index(
+                f"ix_contacts_{field}_trgm",
+                field,
+                postgresql_using="gin",
+                postgresql_ops={field: "gin_trgm_ops"},
+            )
+            for field in ("first_name", "last_name", "email")
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     first_name = Column(String, nullable=False)
@@ -17,9 +61,15 @@ class Contact(Base):
     email = Column(String, nullable=False)
     phone_number = Column(String, nullable=False)
     birth_date = Column(Date, nullable=False)
+    birthday_key = Column(SmallInteger, nullable=False)  # Kept in sync, see below
     additional_info = Column(String, nullable=True)  # Optional field
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
+    @validates("birth_date")
+    def _sync_birthday_key(self, key, birth_date):
+        self.birthday_key = birthday_key(birth_date)
+        return birth_date
+
 
 class User(Base):
     """
@@ -32,4 +82,6 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     password = Column(String, nullable=False)
     avatar = Column(String, nullable=True, default=None)  # Optional field
+    # Sized copies of the avatar, e.g. {"small": url}, see AVATAR_VARIANTS
+    avatar_variants = Column(JSON, nullable=True, default=None)
     role = Column(String, nullable=False, default="USER")
@@ -0,0 +1,151 @@
+import logging
+import time
+
+from uuid import uuid4
+from app.local_cache import LocalCache
+from app.metrics import timed
+from app.redis_client import RedisDB
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Limits per route, "<requests>/<period>". The only place limits are set.
+RATE_LIMITS = {
+    "me": "5/minute",
+}
+RATE_LIMIT_PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+# While a key has used less than half its limit, a worker takes this share
+# of the limit from Redis at once and spends it locally, so most requests
+# skip Redis. Small limits get no leases: every request asks Redis.
+RATE_LIMIT_LEASE_FRACTION = settings.rate_limit_lease_fraction
+# Leased requests are counted when leased, so they must be spent soon
+RATE_LIMIT_LEASE_TTL = settings.rate_limit_lease_ttl  # seconds
+RATE_LIMIT_LOCAL_KEYS = settings.rate_limit_local_keys
+
+# Sliding window log: the scores of the sorted set are the times of the
+# requests in the window. Takes up to ARGV[3] requests at once and returns
+# how many it took, and if none, the milliseconds until one frees up.
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local used = redis.call('ZCARD', KEYS[1])
+if (used + wanted) * 2 > limit then
+    wanted = 1
+end
+local taken = math.min(wanted, limit - used)
+if taken > 0 then
+    for i = 1, taken do
+        redis.call('ZADD', KEYS[1], now, ARGV[4] .. ':' .. i)
+    end
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {taken, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, tonumber(oldest[2]) + window - now}
+"""
+
+
+def rate_limits_db():
+    return RedisDB().select(RedisDB.DBs.RATE_LIMITS)
+
+
+def parse_rate(rate):
+    """
+    Return the number of requests and the window in seconds of a rate.
+
+    Args:
+        rate (str): The rate, e.g. "5/minute".
+    """
+    requests, period = rate.split("/")
+    return int(requests), RATE_LIMIT_PERIODS[period]
+
+
+class RateLimiter:
+    """
+    Sliding window rate limiter shared by every worker through Redis. The
+    window is checked and updated by one Lua script, so concurrent workers
+    never admit more than the limit. Workers lease requests in bulk while
+    a key is far from its limit, and remember keys that hit it until their
+    window frees up, so neither case costs a Redis round trip.
+    """
+
+    def __init__(self, lease_fraction=RATE_LIMIT_LEASE_FRACTION):
+        self.lease_fraction = lease_fraction
+        self.local = 0  # Requests decided without Redis
+        self.remote = 0  # Requests decided by Redis
+        self.rejected = 0
+        self._leases = LocalCache(RATE_LIMIT_LOCAL_KEYS, RATE_LIMIT_LEASE_TTL)
+        self._blocked = LocalCache(RATE_LIMIT_LOCAL_KEYS, RATE_LIMIT_LEASE_TTL)
+        self._script = None
+
+    async def hit(self, route, key):
+        """
+        Count a request against the limit of a route. Returns None if the
+        request is allowed, else the seconds until the next one will be.
+        Requests are allowed when Redis cannot be reached.
+
+        Args:
+            route (str): The route, a key of RATE_LIMITS.
+            key (str): Whom the request is counted for, e.g. "user:1".
+        """
+        limit, window = parse_rate(RATE_LIMITS[route])
+        name = f"{route}:{key}"
+        lease = self._leases.get(name)
+        if lease:
+            lease[0] -= 1
+            if not lease[0]:
+                self._leases.pop(name)
+            self.local += 1
+            return None
+        retry_at = self._blocked.get(name)
+        if retry_at is not None:
+            self.local += 1
+            self.rejected += 1
+            return retry_at - time.monotonic()
+        wanted = max(1, int(limit * self.lease_fraction))
+        try:
+            taken, retry_ms = await self._take(name, limit, window, wanted)
+        except Exception:
+            logger.exception("Could not check the rate limit of %s", name)
+            return None
+        self.remote += 1
+        if taken:
+            if taken > 1:
+                self._leases.set(name, [taken - 1])
+            return None
+        self.rejected += 1
+        retry_after = retry_ms / 1000
+        self._blocked.set(name, time.monotonic() + retry_after, ttl=retry_after)
+        return retry_after
+
+    async def _take(self, name, limit, window, wanted):
+        namespace = rate_limits_db()
+        if self._script is None:
+            self._script = namespace.client.register_script(SLIDING_WINDOW_SCRIPT)
+        with timed("redis", "rate_limit"):
+            taken, retry_ms = await self._script(
+                keys=[namespace.key(name)],
+                args=[limit, window * 1000, wanted, uuid4().hex],
+                client=namespace.client,
+            )
+        return int(taken), int(retry_ms)
+
+    def clear(self):
+        """
+        Forget the leases and blocked keys of this worker.
+        """
+        self._leases.clear()
+        self._blocked.clear()
+
+    def status(self):
+        """
+        Return the counters of the limiter.
+        """
+        return {"local": self.local, "remote": self.remote, "rejected": self.rejected}
+
+
+rate_limiter = RateLimiter()
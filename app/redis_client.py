@@ -1,27 +1,79 @@
-from dotenv import load_dotenv
 from enum import Enum
-import os
-import redis
+from app.metrics import timed
+from app.settings import settings
+import inspect
+import redis.asyncio as redis
 
-load_dotenv()
+# Connection pool shared by every namespace, per worker process
+REDIS_MAX_CONNECTIONS = settings.redis_max_connections
+REDIS_POOL_TIMEOUT = settings.redis_pool_timeout  # seconds
+REDIS_SOCKET_TIMEOUT = settings.redis_socket_timeout  # seconds
+REDIS_CONNECT_TIMEOUT = settings.redis_connect_timeout  # seconds
+REDIS_HEALTH_CHECK_INTERVAL = settings.redis_health_check_interval
+
+
+class RedisNamespace:
+    """
+    View of a Redis client confined to a key prefix.
+
+    Commands whose first argument is a key can be called on it directly,
+    e.g. ``await namespace.get(email)``; the key gets prefixed and the call
+    timed. For other commands use ``client`` with ``key()``.
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str):
+        self.client = client
+        self.prefix = f"{prefix}:"
+
+    def key(self, key: str) -> str:
+        """
+        Return the full Redis key of a key in this namespace.
+
+        Args:
+            key (str): The key within the namespace.
+        """
+        return self.prefix + key
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def prefixed(key, *args, **kwargs):
+            result = command(self.key(key), *args, **kwargs)
+            if not inspect.isawaitable(result):
+                return result
+            return timed_call(name, result)
+
+        return prefixed
+
+
+async def timed_call(command, call):
+    with timed("redis", command):
+        return await call
 
 
 class RedisDB:
     """
-    Singleton class to manage Redis database connections.
+    Singleton class to manage the Redis connection pool and its namespaces.
     """
 
     class DBs(Enum):
         """
-        Enum for Redis database indices.
+        Enum for Redis namespaces, the values are their key prefixes.
         """
 
-        PENDING_USERS = 0
-        CURRENT_ACTIVE_USERS = 1
-        PENDING_PASSWORD_RESETS = 2
+        PENDING_USERS = "pending_users"
+        CURRENT_ACTIVE_USERS = "current_active_users"
+        PENDING_PASSWORD_RESETS = "pending_password_resets"
+        EMAIL_DELIVERIES = "email_deliveries"
+        CONTACTS_VERSIONS = "contacts_versions"
+        RESPONSE_CACHE = "response_cache"
+        AVATAR_JOBS = "avatar_jobs"
+        AVATAR_ASSETS = "avatar_assets"
+        RATE_LIMITS = "rate_limits"
 
     _instance = None
-    _clients = {}
+    _client = None
+    _namespaces = {}
 
     def __new__(cls):
         """
@@ -29,21 +81,48 @@ class RedisDB:
         """
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            for db in RedisDB.DBs:
-                cls._instance._clients[db] = redis.Redis(
-                    host=os.getenv("REDIS_HOST"),
-                    port=os.getenv("REDIS_PORT"),
-                    db=db.value,
-                    decode_responses=True,
-                )
+            pool = redis.BlockingConnectionPool(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                timeout=REDIS_POOL_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                decode_responses=True,
+            )
+            cls._instance.use(redis.Redis(connection_pool=pool))
         return cls._instance
 
+    def use(self, client: redis.Redis):
+        """
+        Serve every namespace from the given client.
+
+        Args:
+            client (redis.Redis): The client, e.g. a fakeredis one in tests.
+        """
+        self._client = client
+        self._namespaces = {db: RedisNamespace(client, db.value) for db in RedisDB.DBs}
+
+    @property
+    def client(self) -> redis.Redis:
+        """
+        The client shared by all namespaces.
+        """
+        return self._client
+
     @classmethod
-    def select(cls, db: DBs) -> redis.Redis:
+    def select(cls, db: DBs) -> RedisNamespace:
         """
-        Select a Redis database.
+        Select a Redis namespace.
 
         Args:
-            db (DBs): The database to select.
+            db (DBs): The namespace to select.
+        """
+        return cls._instance._namespaces[db]
+
+    async def close(self):
+        """
+        Close the client and disconnect its connection pool.
         """
-        return cls._instance._clients[db]
+        await self._client.aclose()
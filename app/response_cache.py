@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import orjson
+
+from app.db import SessionLocal
+from app.redis_client import RedisDB
+from app.settings import settings
+
+RESPONSE_CACHE_TTL = settings.response_cache_ttl  # seconds
+# A worker computing a missed response holds a lock for this long at most,
+# the other workers wait for its result meanwhile instead of computing it
+RESPONSE_CACHE_LOCK_TTL = settings.response_cache_lock_ttl  # seconds
+RESPONSE_CACHE_POLL_INTERVAL = 0.025  # seconds
+
+
+def response_cache_db():
+    return RedisDB().select(RedisDB.DBs.RESPONSE_CACHE)
+
+
+def cache_key(user_id, version, endpoint, params) -> str:
+    """
+    Return the cache key of a response. The key includes the version of
+    the user's contacts, so any change to them makes the cached responses
+    unreachable; they then expire with their TTL.
+
+    Args:
+        user_id (int): The user's id.
+        version (str): The version of the user's contacts.
+        endpoint (str): The endpoint name.
+        params (dict): The normalized endpoint parameters.
+    """
+    digest = hashlib.sha256(orjson.dumps(params, option=orjson.OPT_SORT_KEYS))
+    return f"{user_id}:{version}:{endpoint}:{digest.hexdigest()[:32]}"
+
+
+def encode_entry(body: bytes, headers: dict) -> bytes:
+    return orjson.dumps(headers) + b"\n" + body
+
+
+def decode_entry(entry):
+    if isinstance(entry, str):
+        entry = entry.encode()
+    headers, body = entry.split(b"\n", 1)
+    return body, orjson.loads(headers)
+
+
+class ResponseCache:
+    """
+    Cache of serialized responses in Redis. On a miss one request computes
+    the response: concurrent requests of the same worker await its result,
+    and those of other workers poll for it while it holds a Redis lock.
+    The response is computed on a session of its own, as it outlives the
+    request that started it when that request's client disconnects.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, lock_ttl=RESPONSE_CACHE_LOCK_TTL):
+        self.sessions = SessionLocal
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Misses that awaited a request of the same worker
+        self.lock_waits = 0  # Misses served by another worker's result
+        self._loading = {}
+
+    async def get_or_load(self, key, load):
+        """
+        Return the cached (body, headers) of a response, computing and
+        caching them with load(db) on a miss.
+
+        Args:
+            key (str): The cache key, from cache_key.
+            load: Coroutine function of a database session, returning the
+                body and headers. It must not use the request's session.
+        """
+        entry = await response_cache_db().get(key)
+        if entry is not None:
+            self.hits += 1
+            return decode_entry(entry)
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, load))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded, a disconnecting client does not cancel the others' result
+        return await asyncio.shield(task)
+
+    async def _load(self, key, load):
+        lock = f"{key}:lock"
+        locked = await response_cache_db().set(
+            lock, 1, nx=True, px=int(self.lock_ttl * 1000)
+        )
+        if not locked:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.lock_ttl
+            while loop.time() < deadline:
+                await asyncio.sleep(RESPONSE_CACHE_POLL_INTERVAL)
+                entry = await response_cache_db().get(key)
+                if entry is not None:
+                    self.lock_waits += 1
+                    return decode_entry(entry)
+        # Computed here, also when the other worker took too long
+        self.misses += 1
+        try:
+            async with self.sessions() as db:
+                body, headers = await load(db)
+            await response_cache_db().set(key, encode_entry(body, headers), ex=self.ttl)
+        finally:
+            if locked:
+                await response_cache_db().delete(lock)
+        return body, headers
+
+    def status(self):
+        """
+        Return the hit and miss counters of the cache.
+        """
+        lookups = self.hits + self.misses + self.coalesced + self.lock_waits
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "lock_waits": self.lock_waits,
+            "hit_ratio": (lookups - self.misses) / lookups if lookups else None,
+        }
+
+
+response_cache = ResponseCache()
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import date
-from typing import Optional
+from typing import Annotated, Dict, List, Literal, Optional, Union
 
 
 class ContactCreate(BaseModel):
@@ -30,6 +30,60 @@ class ContactRead(ContactCreate):
         orm_mode = True
 
 
+class ContactCreateOperation(BaseModel):
+    """
+    Batch operation creating a contact.
+    """
+
+    op: Literal["create"]
+    contact: ContactCreate
+
+
+class ContactUpdateOperation(BaseModel):
+    """
+    Batch operation replacing the fields of a contact.
+    """
+
+    op: Literal["update"]
+    id: int
+    contact: ContactCreate
+
+
+class ContactDeleteOperation(BaseModel):
+    """
+    Batch operation deleting a contact.
+    """
+
+    op: Literal["delete"]
+    id: int
+
+
+ContactOperation = Annotated[
+    Union[ContactCreateOperation, ContactUpdateOperation, ContactDeleteOperation],
+    Field(discriminator="op"),
+]
+
+
+class ContactBatch(BaseModel):
+    """
+    ContactBatch schema, contact operations applied in one transaction.
+    """
+
+    operations: List[ContactOperation] = Field(max_length=1000)
+
+
+class ContactOperationResult(BaseModel):
+    """
+    ContactOperationResult schema, the outcome of one batch operation. The
+    status is the one the single-contact endpoint would have returned.
+    """
+
+    op: str
+    status: int
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
 class UserCreate(BaseModel):
     """
     UserCreate schema for creating a new user.
@@ -75,3 +129,19 @@ class UserResetPassword(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class CurrentUser(BaseModel):
+    """
+    CurrentUser schema, the projection of an authenticated user that is
+    cached between requests.
+    """
+
+    id: int
+    email: str
+    role: str
+    avatar: Optional[str] = None
+    avatar_variants: Optional[Dict[str, str]] = None
+
+    class Config:
+        orm_mode = True
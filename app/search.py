@@ -0,0 +1,147 @@
+import operator
+import re
+
+from collections import defaultdict
+from functools import reduce
+from sqlalchemy import func
+from app.models import Contact
+
+SEARCH_FIELDS = ("first_name", "last_name", "email")
+_WORD_SEPARATOR = re.compile(r"[\W_]+")
+
+
+def trigrams(text):
+    """
+    Split a string into trigrams the same way pg_trgm does: lowercase it,
+    break it into words and pad every word with two leading spaces and one
+    trailing space.
+
+    Args:
+        text (str): The string to split.
+    """
+    result = set()
+    for word in _WORD_SEPARATOR.split(text.lower()):
+        if word:
+            padded = f"  {word} "
+            result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(left, right):
+    """
+    Return the pg_trgm similarity of two strings: the number of shared
+    trigrams divided by the number of distinct trigrams in both.
+
+    Args:
+        left (str): The first string.
+        right (str): The second string.
+    """
+    left, right = trigrams(left), trigrams(right)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def escape_like(term):
+    """
+    Escape the LIKE wildcards in a search term so it matches literally.
+
+    Args:
+        term (str): The search term.
+    """
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class TrigramIndex:
+    """
+    In-memory substring index over contact fields, ranking the matches
+    like pg_trgm on databases without that extension (e.g. SQLite).
+    """
+
+    def __init__(self, contacts=()):
+        self._contacts = {}
+        self._postings = defaultdict(set)
+        for contact in contacts:
+            self.add(contact)
+
+    def add(self, contact):
+        """
+        Add a contact to the index.
+
+        Args:
+            contact (Contact): The contact to index.
+        """
+        self._contacts[contact.id] = contact
+        for field in SEARCH_FIELDS:
+            value = getattr(contact, field).lower()
+            for i in range(len(value) - 2):
+                self._postings[field, value[i : i + 3]].add(contact.id)
+
+    def search(self, terms, limit):
+        """
+        Return the contacts whose fields contain every term, case
+        insensitively, best matches first.
+
+        Args:
+            terms (dict): Search term by field name.
+            limit (int): The maximum number of contacts to return.
+        """
+        candidates = set(self._contacts)
+        for field, term in terms.items():
+            term = term.lower()
+            # A substring of a value shares all of its trigrams with it, so
+            # intersecting the posting lists narrows the candidates down
+            # before the exact check. Terms under 3 characters have none.
+            for i in range(len(term) - 2):
+                candidates &= self._postings.get((field, term[i : i + 3]), set())
+            candidates = {
+                contact_id
+                for contact_id in candidates
+                if term in getattr(self._contacts[contact_id], field).lower()
+            }
+
+        def score(contact):
+            rank = sum(
+                similarity(getattr(contact, field), term)
+                for field, term in terms.items()
+            )
+            return -rank, contact.id
+
+        matches = (self._contacts[contact_id] for contact_id in candidates)
+        return sorted(matches, key=score)[:limit]
+
+
+async def find_contacts(db, contacts, terms, limit):
+    """
+    Find the contacts whose fields contain the given terms, ranked by
+    trigram similarity to them.
+
+    The terms filter the contacts with ILIKE on every database. On
+    PostgreSQL the filters are served by the pg_trgm GIN indexes and
+    ranked with ``similarity()``. Other databases, SQLite in tests and
+    development, have no such index: the filters scan the user's contacts
+    and the matches are ranked in Python with a ``TrigramIndex``. That
+    fallback is not meant for production sizes, and as SQLite lowercases
+    ASCII letters only, it matches other letters case sensitively.
+
+    Args:
+        db (AsyncSession): The database session.
+        contacts (Select): The query selecting the columns of the user's
+            contacts, see ``app.serialization.contact_columns``.
+        terms (dict): Search term by field name, see ``SEARCH_FIELDS``.
+        limit (int): The maximum number of contacts to return.
+    """
+    rank = []
+    for field, term in terms.items():
+        column = getattr(Contact, field)
+        pattern = f"%{escape_like(term)}%"
+        contacts = contacts.where(column.ilike(pattern, escape="\\"))
+        rank.append(func.similarity(column, term))
+
+    if db.get_bind().dialect.name != "postgresql":
+        return TrigramIndex((await db.execute(contacts)).all()).search(terms, limit)
+
+    order_by = [Contact.id]
+    if rank:
+        order_by.insert(0, reduce(operator.add, rank).desc())
+    return (await db.execute(contacts.order_by(*order_by).limit(limit))).all()
@@ -0,0 +1,66 @@
+import orjson
+
+from starlette.responses import Response
+from app.models import Contact
+from app.schemas import ContactRead
+
+# ContactRead fields, in the order they appear in its JSON
+CONTACT_FIELDS = tuple(ContactRead.model_fields)
+
+
+def contact_columns(contacts):
+    """
+    Narrow a query of contacts to the ContactRead columns, so it returns
+    plain rows instead of ORM objects.
+
+    Args:
+        contacts (Select): The query selecting contacts.
+    """
+    return contacts.with_only_columns(
+        *(getattr(Contact, field) for field in CONTACT_FIELDS)
+    )
+
+
+def contact_dict(row) -> dict:
+    """
+    Return a contact row from contact_columns as a ContactRead dict.
+
+    Args:
+        row (Row): The row.
+    """
+    return dict(zip(CONTACT_FIELDS, row))
+
+
+def encode_contacts(rows) -> bytes:
+    """
+    Encode contact rows from contact_columns as a JSON list. The columns
+    are already of the ContactRead types, so they are not validated again.
+
+    Args:
+        rows (List[Row]): The rows.
+    """
+    return orjson.dumps([contact_dict(row) for row in rows])
+
+
+def encode_contact(row) -> bytes:
+    """
+    Encode a contact row from contact_columns as a JSON object.
+
+    Args:
+        row (Row): The row.
+    """
+    return orjson.dumps(contact_dict(row))
+
+
+class JSONBytesResponse(Response):
+    """
+    JSON response encoded with orjson. Content that is already encoded,
+    e.g. from encode_contacts or the response cache, is sent as is.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content)
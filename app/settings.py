@@ -0,0 +1,104 @@
+import os
+
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class Settings(BaseModel):
+    """
+    The configuration of the application, read once from the environment
+    and the .env file. Every setting is named after its variable in lower
+    case, e.g. db_pool_size is set by DB_POOL_SIZE; values are validated
+    and converted to the annotated types.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    # Database, see app/db.py
+    database_url: Optional[str] = None
+    db_statement_cache_size: int = 500
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30  # seconds
+    db_pool_recycle: int = 1800  # seconds, -1 never
+    db_pool_pre_ping: bool = True
+    db_slow_query_ms: float = 200
+    debug: bool = False
+
+    # Access tokens, see app/api.py
+    secret_key: Optional[str] = None
+    algorithm: Optional[str] = None
+    token_cache_size: int = 10000
+
+    # Redis, see app/redis_client.py
+    redis_host: Optional[str] = None
+    redis_port: Optional[int] = None
+    redis_max_connections: int = 50
+    redis_pool_timeout: float = 5  # seconds
+    redis_socket_timeout: float = 2  # seconds
+    redis_connect_timeout: float = 2  # seconds
+    redis_health_check_interval: int = 30  # seconds
+
+    # Emails, see app/email_utils.py
+    smtp_host: str = "smtp.gmail.com"
+    smtp_port: int = 587
+    smtp_starttls: bool = True
+    smtp_timeout: float = 30  # seconds
+    env_email: Optional[str] = None
+    env_email_password: Optional[str] = None
+    email_workers: int = 2
+    email_batch_size: int = 20
+    email_max_attempts: int = 5
+    email_retry_backoff: float = 2  # seconds
+
+    # Avatars, see app/cloudinary_utils.py and app/avatar_jobs.py
+    cloudinary_cloud_name: Optional[str] = None
+    cloudinary_api_key: Optional[str] = None
+    cloudinary_api_secret: Optional[str] = None
+    avatar_max_bytes: int = 10 * 1024 * 1024
+    avatar_workers: int = 2
+
+    # Password hashing, see app/hashing.py
+    hash_workers: int = Field(default_factory=lambda: min(4, os.cpu_count() or 1))
+    hash_queue_size: int = 32
+
+    # Caches and rate limits
+    rate_limit_lease_fraction: float = 0.1
+    rate_limit_lease_ttl: float = 1  # seconds
+    rate_limit_local_keys: int = 10000
+    response_cache_ttl: int = 300  # seconds
+    response_cache_lock_ttl: float = 5  # seconds
+    user_local_cache_size: int = 10000
+    user_local_cache_ttl: float = 60  # seconds
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        Read the settings from environment variables. Unset variables keep
+        their default.
+
+        Args:
+            environ (dict): The variables, by default os.environ.
+        """
+        environ = os.environ if environ is None else environ
+        return cls(
+            **{
+                name: environ[name.upper()]
+                for name in cls.model_fields
+                if name.upper() in environ
+            }
+        )
+
+
+@lru_cache(maxsize=None)
+def get_settings():
+    """
+    Return the settings, loading the .env file on the first call.
+    """
+    load_dotenv()
+    return Settings.from_env()
+
+
+settings = get_settings()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import orjson
+
+from typing import Optional
+from app.local_cache import LocalCache
+from app.redis_client import RedisDB
+from app.schemas import CurrentUser
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump when the record layout changes. Records of other versions read as
+# misses and get overwritten, so the cache never needs a flush.
+USER_CACHE_VERSION = 2
+USER_FIELDS = ("id", "email", "role", "avatar", "avatar_variants")
+USER_CACHE_TTL = 24 * 60 * 60  # Redis tier, 24 hours in seconds
+# In-process tier, per worker. Invalidations arrive over pub/sub; the TTL
+# only bounds staleness if one is missed while reconnecting.
+USER_LOCAL_CACHE_SIZE = settings.user_local_cache_size
+USER_LOCAL_CACHE_TTL = settings.user_local_cache_ttl  # seconds
+INVALIDATION_CHANNEL = "current_active_users:invalidations"
+
+local_users = LocalCache(USER_LOCAL_CACHE_SIZE, USER_LOCAL_CACHE_TTL)
+
+
+def encode_user(user) -> bytes:
+    """
+    Encode the cached projection of a user.
+
+    Args:
+        user (User | CurrentUser): The user to encode.
+    """
+    record = {field: getattr(user, field) for field in USER_FIELDS}
+    record["v"] = USER_CACHE_VERSION
+    return orjson.dumps(record)
+
+
+def decode_user(raw) -> Optional[CurrentUser]:
+    """
+    Decode a cached user, or return None if there is nothing usable.
+
+    Args:
+        raw (str | bytes | None): The cached record.
+    """
+    if raw is None:
+        return None
+    try:
+        record = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(record, dict) or record.get("v") != USER_CACHE_VERSION:
+        return None
+    # Written by encode_user from a validated user, so skip validation
+    fields = {field: record[field] for field in USER_FIELDS}
+    return CurrentUser.model_construct(**fields)
+
+
+def current_active_users_db():
+    return RedisDB().select(RedisDB.DBs.CURRENT_ACTIVE_USERS)
+
+
+async def get_cached_user(email: str) -> Optional[CurrentUser]:
+    """
+    Return the cached projection of a user, from this worker's memory if
+    possible, else from Redis. None if neither has it.
+
+    Args:
+        email (str): The user's email.
+    """
+    user = local_users.get(email)
+    if user is None:
+        user = decode_user(await current_active_users_db().get(email))
+        if user is not None:
+            local_users.set(email, user)
+    return user
+
+
+async def cache_user(user: CurrentUser):
+    """
+    Cache the projection of a user in both tiers.
+
+    Args:
+        user (CurrentUser): The user to cache.
+    """
+    await current_active_users_db().set(
+        user.email, encode_user(user), ex=USER_CACHE_TTL
+    )
+    local_users.set(user.email, user)
+
+
+async def invalidate_user(email: str):
+    """
+    Drop a user from the cache of every worker. Call it whenever a stored
+    user changes, e.g. its avatar, password or role.
+
+    Args:
+        email (str): The user's email.
+    """
+    local_users.pop(email)
+    await current_active_users_db().delete(email)
+    await RedisDB().client.publish(INVALIDATION_CHANNEL, email)
+
+
+async def listen_for_invalidations():
+    """
+    Evict users invalidated by any worker from this worker's memory.
+    Runs until cancelled, resubscribing if the connection drops.
+    """
+    while True:
+        try:
+            pubsub = RedisDB().client.pubsub(ignore_subscribe_messages=True)
+            async with pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Invalidations sent while unsubscribed were missed
+                local_users.clear()
+                async for message in pubsub.listen():
+                    local_users.pop(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("User invalidation listener failed, resubscribing")
+            await asyncio.sleep(1)
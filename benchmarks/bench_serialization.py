@@ -0,0 +1,108 @@
+"""
+Rows per second of the contact list serialization paths, from the query
+to the JSON body:
+
+- orm: ORM objects validated into ContactRead, then jsonable_encoder and
+  the stdlib json encoder, as FastAPI does for a response_model.
+- adapter: ORM objects validated and dumped by a pydantic TypeAdapter.
+- core: the ContactRead columns as Core rows encoded with orjson, as the
+  list endpoints do now.
+
+Usage: python -m benchmarks.bench_serialization [rows] [repeats]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from datetime import date, timedelta
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.models import Base, Contact, User  # noqa: E402
+from app.schemas import ContactRead  # noqa: E402
+from app.serialization import contact_columns, encode_contacts  # noqa: E402
+
+
+def seed(path, rows):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(User).values(id=1, email="user@example.com", password="x")
+        )
+        connection.execute(
+            insert(Contact),
+            [
+                {
+                    "first_name": f"First{i}",
+                    "last_name": f"Last{i}",
+                    "email": f"contact{i}@example.com",
+                    "phone_number": f"{i:09d}",
+                    "birth_date": date(1980, 1, 1) + timedelta(days=i % 10000),
+                    "birthday_key": 101,
+                    "additional_info": None if i % 2 else "Met at a conference",
+                    "user_id": 1,
+                }
+                for i in range(rows)
+            ],
+        )
+    engine.dispose()
+
+
+async def orm_path(db, contacts):
+    page = (await db.scalars(contacts)).all()
+    models = [ContactRead.model_validate(c, from_attributes=True) for c in page]
+    return json.dumps(jsonable_encoder(models)).encode()
+
+
+CONTACT_LIST = TypeAdapter(List[ContactRead])
+
+
+async def adapter_path(db, contacts):
+    page = (await db.scalars(contacts)).all()
+    models = CONTACT_LIST.validate_python(page, from_attributes=True)
+    return CONTACT_LIST.dump_json(models)
+
+
+async def core_path(db, contacts):
+    return encode_contacts((await db.execute(contact_columns(contacts))).all())
+
+
+async def main(rows, repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(path, rows)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        contacts = select(Contact).where(Contact.user_id == 1).order_by(Contact.id)
+        bodies = {}
+        for name, path_function in (
+            ("orm", orm_path),
+            ("adapter", adapter_path),
+            ("core", core_path),
+        ):
+            best = float("inf")
+            for _ in range(repeats):
+                # A fresh session, so the ORM path pays for its identity map
+                async with sessions() as db:
+                    started = time.perf_counter()
+                    bodies[name] = await path_function(db, contacts)
+                    best = min(best, time.perf_counter() - started)
+            print(f"{name:>7}: {rows / best:>10,.0f} rows/s ({best * 1000:.1f} ms)")
+        await engine.dispose()
+    assert len({json.dumps(json.loads(body)) for body in bodies.values()}) == 1
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(rows, repeats))
@@ -2,3 +2,213 @@ import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import cloudinary
+import fakeredis
+import json
+import pytest
+import re
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from unittest.mock import patch
+from app.cloudinary_utils import configure_cloudinary, is_public_address
+from app.db import normalize_sql
+from app.models import Base
+from app.rate_limit import rate_limiter
+from app.redis_client import RedisDB
+from app.response_cache import response_cache
+from app.user_cache import local_users
+
+
+@pytest.fixture
+def anyio_backend():
+    """Run async tests on asyncio, the event loop the app is served on."""
+    return "asyncio"
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    """SQLite database file holding the application schema."""
+    path = tmp_path / "contacts.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def seed_session(database_path):
+    """Sync session on the test database, for seeding and checking rows."""
+    engine = create_engine(f"sqlite:///{database_path}")
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def get_db_override(database_path, monkeypatch):
+    """
+    Replacement for app.db.get_db yielding async sessions on the test database.
+    The response cache computes its responses on the test database too.
+    """
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool
+    )
+    SessionLocal = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+
+    monkeypatch.setattr(response_cache, "sessions", SessionLocal)
+
+    async def get_db():
+        async with SessionLocal() as db:
+            yield db
+
+    return get_db
+
+
+@pytest.fixture
+def redis_server():
+    """
+    In-memory Redis server serving RedisDB for the duration of a test.
+    Yields a sync client on it to seed and check data from the test.
+    """
+    server = fakeredis.FakeServer()
+    local_users.clear()
+    rate_limiter.clear()
+    redis_db = RedisDB()
+    previous = redis_db.client
+    redis_db.use(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    yield fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_db.use(previous)
+
+
+class CloudinaryStandIn(BaseHTTPRequestHandler):
+    """
+    Answers Cloudinary upload requests like the real API: with the stored
+    asset, or with an error once the server is set to fail. Also serves
+    the source images: GET /images/<content>/<name> returns <content>,
+    and GET /redirect?<url> redirects to <url>.
+    """
+
+    def do_GET(self):
+        self.server.fetches.append(self.path)
+        if self.path.startswith("/redirect?"):
+            self.send_response(302)
+            self.send_header("Location", self.path.split("?", 1)[1])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.reply(200, "image/png", self.path.split("/")[2].encode())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.uploads.append(self.path)
+        if self.server.fail:
+            status, result = 400, {"error": {"message": "Invalid image file"}}
+        else:
+            match = re.search(rb'name="public_id"\r\n\r\n([^\r]*)', body)
+            public_id = match.group(1).decode() if match else "sample"
+            status, result = 200, {
+                "public_id": public_id,
+                "version": 1700000000 + len(self.server.uploads),
+                "secure_url": f"https://res.cloudinary.com/test/{public_id}.png",
+            }
+        self.reply(status, "application/json", json.dumps(result).encode())
+
+    def reply(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def cloudinary_server():
+    """
+    Local stand-in for the Cloudinary upload API, which cloudinary is
+    configured to call for the duration of a test. Set its fail attribute
+    to make the uploads fail; uploads and fetches list the paths called.
+    Avatar images may be fetched from loopback addresses meanwhile.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CloudinaryStandIn)
+    server.fail = False
+    server.uploads = []
+    server.fetches = []
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    configure_cloudinary()  # Done once, so it cannot override the test's later
+    config = cloudinary.config()
+    previous = {
+        name: getattr(config, name, None)
+        for name in ("cloud_name", "api_key", "api_secret", "upload_prefix")
+    }
+    cloudinary.config(
+        cloud_name="test",
+        api_key="key",
+        api_secret="secret",
+        upload_prefix=server.url,
+    )
+    with patch(
+        "app.cloudinary_utils.is_public_address",
+        lambda address: address == "127.0.0.1" or is_public_address(address),
+    ):
+        yield server
+    cloudinary.config(**previous)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def avatar_sessions(database_path, monkeypatch):
+    """
+    Make the avatar queue store avatars in the test database. Returns the
+    session factory, for queues created by the test.
+    """
+    import app.avatar_jobs
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool
+    )
+    sessions = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    monkeypatch.setattr(app.avatar_jobs.avatar_queue, "sessions", sessions)
+    return sessions
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Fail the test when a block runs more SQL statements than allowed, so
+    N+1 regressions fail CI: ``with max_queries(2): client.get(url)``.
+    Counts the statements of every engine and thread; yields their SQL.
+    """
+
+    @contextmanager
+    def limit(count):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(normalize_sql(statement))
+
+        event.listen(Engine, "after_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, "after_cursor_execute", record)
+        assert len(statements) <= count, "\n".join(
+            [f"{len(statements)} statements, expected at most {count}:", *statements]
+        )
+
+    return limit
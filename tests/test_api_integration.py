@@ -1,17 +1,50 @@
+import gzip
+import hashlib
+import json
+import jsonpickle
 import pytest
+import time
 from app.main import app as fastapp
 import app.api
 import app.main
 from fastapi.testclient import TestClient
-from datetime import date
+from datetime import date, timedelta
 from unittest.mock import patch
+from sqlalchemy import select
 
+import app.contact_batch
 import app.models
+import app.search
+import app.user_cache
+from app.hashing import HashingSaturated
+from app.redis_client import RedisDB
 
 
-class ContactsQueryMock:
-    def __init__(self):
-        self._data = [
+def seed_contacts(session, contacts):
+    session.add(
+        app.models.User(
+            id=1,
+            email="user@example.com",
+            password="hashed_password",
+            avatar="http://example.com/avatar.png",
+        )
+    )
+    session.add_all(contacts)
+    session.commit()
+
+
+@pytest.fixture
+def signing_key(monkeypatch):
+    """Sign access tokens with a test key, whatever the environment sets."""
+    monkeypatch.setattr(app.api, "SECRET_KEY", "test-secret-key-of-32-bytes-long")
+    monkeypatch.setattr(app.api, "ALGORITHM", "HS256")
+
+
+@pytest.fixture
+def client(seed_session, get_db_override, redis_server):
+    seed_contacts(
+        seed_session,
+        [
             app.models.Contact(
                 id=1,
                 first_name="John",
@@ -30,100 +63,44 @@ class ContactsQueryMock:
                 birth_date=date(1990, 1, 1),
                 user_id=1,
             ),
-        ]
-
-    def filter(self, *args, **kwargs):
-        return self
-
-    def all(self):
-        return self._data
-
-
-class DBMock:
-    def __init__(self):
-        pass
-
-    def query(self, model):
-        # If type user- return user
-        if model == app.models.User:
-            return UserQueryMock()
-        return ContactsQueryMock()
-
-    def commit(self):
-        pass
-
-    def refresh(self, obj):
-        pass
-
-
-class UserQueryMock:
-    _data = [
-        app.models.User(
-            id=1,
-            email="user@example.com",
-            password="hashed_password",
-            avatar="http://example.com/avatar.png",
-        )
-    ]
-
-    def filter(self, *args, **kwargs):
-        self._data = list(filter(lambda x: x.email == args[0].right.value, self._data))
-        return self
-
-    def first(self):
-        if len(self._data) == 0:
-            return None
-        return self._data[0]
-
-
-@pytest.fixture
-def client():
+        ],
+    )
     fastapp.dependency_overrides[app.api.get_current_user] = lambda: app.models.User(
         id=1,
         email="user@example.com",
         avatar="http://example.com/avatar.png",
         role="USER",
     )
-    fastapp.dependency_overrides[app.api.get_user_contacts] = (
-        lambda: ContactsQueryMock()
-    )
-    fastapp.dependency_overrides[app.db.get_db] = lambda: DBMock()
+    fastapp.dependency_overrides[app.db.get_db] = get_db_override
     with TestClient(fastapp) as c:
         yield c
+    fastapp.dependency_overrides.clear()
 
 
-class RedisMock:
-    _instance = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.data = {}
-        return cls._instance
-
-    def exists(self, key):
-        return key in self.data.keys()
-
-    def hset(self, key, mapping):
-        self.data[key] = mapping
-
-    def expire(self, key, seconds):
-        pass
-
-    def hget(self, key, field):
-        return self.data[key][field]
-
-    def delete(self, key):
-        if key in self.data:
-            del self.data[key]
-
-
-def pending_users_db_mock():
-    return RedisMock()
-
-
-def pending_password_resets_db_mock():
-    return RedisMock()
+@pytest.fixture
+def sqlite_client(seed_session, get_db_override, redis_server):
+    seed_contacts(
+        seed_session,
+        [
+            app.models.Contact(
+                id=i,
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                email=f"contact{i}@example.com",
+                phone_number=f"{i:09d}",
+                birth_date=date(1990, 1, 1),
+                user_id=1,
+            )
+            for i in range(1, 26)
+        ],
+    )
+    fastapp.dependency_overrides[app.api.get_current_user] = lambda: app.models.User(
+        id=1, email="user@example.com", role="USER"
+    )
+    fastapp.dependency_overrides[app.db.get_db] = get_db_override
+    with TestClient(fastapp) as c:
+        yield c
+    fastapp.dependency_overrides.clear()
 
 
 def test_get_me(client):
@@ -133,17 +110,26 @@ def test_get_me(client):
         "id": 1,
         "email": "user@example.com",
         "avatar_url": "http://example.com/avatar.png",
+        "avatar_variants": None,
     }
 
 
+def test_get_me_rate_limit(client):
+    for _ in range(5):
+        assert client.get("/me").status_code == 200
+    response = client.get("/me")
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 60
+    assert client.get("/metrics/rate-limits").json()["rejected"] >= 1
+
+
 def test_get_birthdays(client):
     response = client.get("/birthdays")
     assert response.status_code == 200
     assert response.json() is not None
 
 
-@patch("app.api.pending_users_db", new=pending_users_db_mock)
-def test_register(client):
+def test_register(client, redis_server):
     with patch("app.api.send_email"):
         response = client.post(
             "/register",
@@ -155,19 +141,15 @@ def test_register(client):
     print(f"Roma_log: {response.json()}")
     assert "User registered successfully" in response.json().get("message")
     assert response.status_code == 201
+    key = RedisDB.select(RedisDB.DBs.PENDING_USERS).key("userssr@example.com")
+    assert redis_server.hget(key, "code")
+    assert redis_server.ttl(key) > 0
 
 
-@patch("app.api.pending_password_resets_db", new=pending_password_resets_db_mock)
-@patch("app.api.current_active_users_db", new=pending_users_db_mock)
-def test_authorize_reset(client):
-    # Use patched(mocked) db here to test
-    pending_password_resets_db_mock()._instance.data["user@example.com"] = {}
-    pending_password_resets_db_mock()._instance.data["user@example.com"][
-        "code"
-    ] = "123456"
-    pending_password_resets_db_mock()._instance.data["user@example.com"][
-        "password"
-    ] = "hashed_password"
+def test_authorize_reset(client, redis_server):
+    # Seed the (fake) redis with a pending password reset
+    key = RedisDB.select(RedisDB.DBs.PENDING_PASSWORD_RESETS).key("user@example.com")
+    redis_server.hset(key, mapping={"code": "123456", "password": "hashed_password"})
     with patch("app.api.send_email"):
         response = client.post(
             "/authorize/reset",
@@ -178,6 +160,30 @@ def test_authorize_reset(client):
         )
     print(f"Roma: {response.json()}")
     assert response.status_code == 200
+    assert not redis_server.exists(key)
+
+
+def test_authorize_reset_consumed(client, redis_server):
+    key = RedisDB.select(RedisDB.DBs.PENDING_PASSWORD_RESETS).key("user@example.com")
+    redis_server.hset(key, mapping={"code": "123456", "password": "hashed_password"})
+    body = {"email": "user@example.com", "confirmation_code": "123456"}
+    assert client.post("/authorize/reset", json=body).status_code == 200
+    # Used by an earlier, or concurrent, request
+    response = client.post("/authorize/reset", json=body)
+    assert response.status_code == 404
+
+
+def test_authorize_register_created_concurrently(client, redis_server):
+    key = RedisDB.select(RedisDB.DBs.PENDING_USERS).key("user@example.com")
+    pending = app.models.User(email="user@example.com", password="x", role="USER")
+    redis_server.hset(key, mapping={"user": jsonpickle.dumps(pending), "code": "1"})
+    # The user is created by a concurrent request after the check
+    with patch("sqlalchemy.ext.asyncio.AsyncSession.scalar", return_value=None):
+        response = client.post(
+            "/authorize/register",
+            json={"email": "user@example.com", "confirmation_code": "1"},
+        )
+    assert response.status_code == 409
 
 
 def test_updateAvatar_user(client):
@@ -190,3 +196,661 @@ def test_updateAvatar_user(client):
         )
     print(f"Roma: {response.json()}")
     assert response.status_code == 403
+
+
+def test_get_contacts_keyset_pagination(sqlite_client):
+    response = sqlite_client.get("/contacts/", params={"limit": 10})
+    assert response.status_code == 200
+    assert [c["id"] for c in response.json()] == list(range(1, 11))
+    assert response.headers["X-Next-Cursor"] == "10"
+
+    ids = []
+    after = None
+    while True:
+        params = {"limit": 10}
+        if after is not None:
+            params["after"] = after
+        response = sqlite_client.get("/contacts/", params=params)
+        ids += [c["id"] for c in response.json()]
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+    assert ids == list(range(1, 26))
+
+
+def test_get_contacts_limit_bounds(sqlite_client):
+    assert sqlite_client.get("/contacts/", params={"limit": 0}).status_code == 422
+    assert sqlite_client.get("/contacts/", params={"limit": 1001}).status_code == 422
+
+
+def test_get_contacts_stream_etag(sqlite_client):
+    response = sqlite_client.get("/contacts/", params={"stream": True})
+    assert response.headers["ETag"]
+
+
+def test_get_contacts_stream_ndjson(sqlite_client):
+    response = sqlite_client.get("/contacts/", params={"stream": True, "after": 20})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [21, 22, 23, 24, 25]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_search_contacts(sqlite_client):
+    response = sqlite_client.get("/search", params={"first_name": "first1"})
+    assert response.status_code == 200
+    ids = [c["id"] for c in response.json()]
+    # "First1" itself is the closest match, then First10..First19
+    assert ids[0] == 1
+    assert sorted(ids) == [1] + list(range(10, 20))
+
+    response = sqlite_client.get("/search", params={"email": "contact2", "limit": 3})
+    assert [c["id"] for c in response.json()] == [2, 20, 21]
+
+
+def test_search_contacts_filters_in_sql(sqlite_client, mocker):
+    index = mocker.spy(app.search, "TrigramIndex")
+    response = sqlite_client.get("/search", params={"last_name": "LAST2"})
+    assert response.status_code == 200
+    # Only the matching rows are read to be ranked
+    rows = index.call_args.args[0]
+    assert sorted(row.id for row in rows) == [2] + list(range(20, 26))
+
+
+@pytest.fixture
+def birthdays_session(seed_session):
+    session = seed_session
+    session.add(app.models.User(id=1, email="user@example.com", password="x"))
+    for i, birth_date in enumerate(
+        [
+            date(1990, 12, 30),
+            date(1985, 1, 2),
+            date(1992, 2, 28),
+            date(1992, 2, 29),
+            date(1980, 3, 1),
+            date(1991, 1, 10),
+        ],
+        start=1,
+    ):
+        session.add(
+            app.models.Contact(
+                id=i,
+                first_name="First",
+                last_name="Last",
+                email=f"contact{i}@example.com",
+                phone_number="123456789",
+                birth_date=birth_date,
+                user_id=1,
+            )
+        )
+    session.commit()
+    return session
+
+
+@pytest.mark.parametrize(
+    "start, days, expected",
+    [
+        # December -> January wrap-around
+        (date(2025, 12, 28), 7, {1, 2}),
+        # Month and day are matched together, not separately
+        (date(2025, 1, 1), 7, {2}),
+        # Feb 29 birthdays are celebrated on Feb 28 in common years
+        (date(2025, 2, 20), 8, {3, 4}),
+        (date(2025, 3, 1), 0, {5}),
+        (date(2024, 2, 20), 8, {3}),
+        (date(2024, 2, 29), 1, {4, 5}),
+        (date(2025, 1, 1), 365, {1, 2, 3, 4, 5, 6}),
+    ],
+)
+def test_birthdays_within(birthdays_session, start, days, expected):
+    contacts = birthdays_session.query(app.models.Contact).filter(
+        app.api.birthdays_within(start, days)
+    )
+    assert {c.id for c in contacts} == expected
+
+
+def test_birthday_key_follows_birth_date(birthdays_session):
+    contact = birthdays_session.get(app.models.Contact, 1)
+    assert contact.birthday_key == 1230
+    contact.birth_date = date(1990, 7, 4)
+    birthdays_session.commit()
+    assert contact.birthday_key == 704
+
+
+def test_get_birthdays_days_window(sqlite_client):
+    with patch("app.api.date") as mock_date:
+        mock_date.today.return_value = date(2025, 12, 31)
+        response = sqlite_client.get("/birthdays", params={"days": 1})
+    assert response.status_code == 200
+    assert len(response.json()) == 25
+    assert sqlite_client.get("/birthdays", params={"days": 366}).status_code == 422
+
+
+def test_contact_crud(client):
+    contact = {
+        "first_name": "Ann",
+        "last_name": "Lee",
+        "email": "ann@example.com",
+        "phone_number": "555000111",
+        "birth_date": "1995-06-15",
+    }
+    response = client.post("/contacts/", json=contact)
+    assert response.status_code == 201
+    contact_id = response.json()["id"]
+    assert client.post("/contacts/", json=contact).status_code == 409
+
+    response = client.put(
+        f"/contacts/{contact_id}", json=contact | {"last_name": "Smith"}
+    )
+    assert response.status_code == 200
+    assert client.get(f"/contacts/{contact_id}").json()["last_name"] == "Smith"
+    # John's email and phone number are taken
+    response = client.put(
+        f"/contacts/{contact_id}",
+        json=contact | {"email": "email@m.m", "phone_number": "123456789"},
+    )
+    assert response.status_code == 409
+
+    assert client.delete(f"/contacts/{contact_id}").status_code == 200
+    assert client.get(f"/contacts/{contact_id}").status_code == 404
+
+
+def poll_avatar_job(client, location):
+    for _ in range(200):
+        job = client.get(location).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Avatar job still {job['status']}")
+
+
+def test_updateAvatar_admin(client, seed_session, cloudinary_server, avatar_sessions):
+    fastapp.dependency_overrides[app.api.get_current_user] = lambda: app.models.User(
+        id=1, email="user@example.com", role="ADMIN"
+    )
+    url = f"{cloudinary_server.url}/images/abc/a.png"
+    response = client.post("/updateAvatar", json={"url": url})
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    location = response.headers["Location"]
+    assert location == f"/avatarJobs/{response.json()['job_id']}"
+
+    job = poll_avatar_job(client, location)
+    assert job["status"] == "done"
+    public_id = f"avatars/{hashlib.sha256(b'abc').hexdigest()}"
+    assert job["avatar"] == f"https://res.cloudinary.com/test/{public_id}.png"
+    assert cloudinary_server.uploads == ["/v1_1/test/image/upload"]
+    seed_session.expire_all()
+    user = seed_session.get(app.models.User, 1)
+    assert user.avatar == job["avatar"]
+    assert set(user.avatar_variants) == {"small", "medium", "large"}
+    assert "c_fill,f_auto,g_face,h_64,q_auto,w_64" in user.avatar_variants["small"]
+    assert job["avatar_small"] == user.avatar_variants["small"]
+
+
+def test_updateAvatar_failed_upload(client, cloudinary_server, avatar_sessions):
+    fastapp.dependency_overrides[app.api.get_current_user] = lambda: app.models.User(
+        id=1, email="user@example.com", role="ADMIN"
+    )
+    cloudinary_server.fail = True
+    url = f"{cloudinary_server.url}/images/abc/a.png"
+    response = client.post("/updateAvatar", json={"url": url})
+    assert response.status_code == 202
+
+    job = poll_avatar_job(client, response.headers["Location"])
+    assert job["status"] == "failed"
+    assert "Invalid image file" in job["error"]
+
+
+def test_avatar_job_of_other_user(client, redis_server):
+    redis_server.hset(
+        f"{RedisDB.DBs.AVATAR_JOBS.value}:abc", mapping={"status": "done", "user_id": 2}
+    )
+    assert client.get("/avatarJobs/abc").status_code == 404
+    assert client.get("/avatarJobs/unknown").status_code == 404
+
+
+def test_prometheus_metrics(client):
+    assert client.get("/contacts/1").status_code == 200
+    assert client.get("/contacts/999").status_code == 404
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    # Labelled by route template, not by path
+    counts = {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in lines
+        if line.startswith("http_requests_total{")
+    }
+    route = 'method="GET",route="/contacts/{contact_id}"'
+    assert counts[f'http_requests_total{{{route},status="200"}}'] >= 1
+    assert counts[f'http_requests_total{{{route},status="404"}}'] >= 1
+    assert 'http_requests_in_progress{method="GET"} 1' in lines
+    assert any(
+        line.startswith('dependency_duration_seconds_count{dependency="redis"')
+        for line in lines
+    )
+
+
+def test_query_counts(client, max_queries):
+    contact = {
+        "first_name": "Ann",
+        "last_name": "Lee",
+        "email": "ann@example.com",
+        "phone_number": "555000111",
+        "birth_date": "1990-01-01",
+    }
+    with max_queries(1):
+        assert client.get("/contacts/").status_code == 200
+    with max_queries(1):
+        assert client.get("/contacts/1").status_code == 200
+    with max_queries(1):
+        assert client.get("/birthdays").status_code == 200
+    with max_queries(1):
+        assert client.post("/contacts/", json=contact).status_code == 201
+    # Selects, updates and refreshes the contact
+    contact["phone_number"] = "555000222"
+    with max_queries(3):
+        assert client.put("/contacts/1", json=contact).status_code == 200
+    with max_queries(2):
+        assert client.delete("/contacts/2").status_code == 200
+    with max_queries(0):
+        assert client.get("/me").status_code == 200
+
+
+def test_query_headers_in_debug_mode(client):
+    assert "X-DB-Query-Count" not in client.get("/contacts/1").headers
+    with patch("app.db.DB_QUERY_HEADERS", True):
+        response = client.get("/contacts/2")
+    assert response.headers["X-DB-Query-Count"] == "1"
+    assert response.headers["X-DB-Query-Time"].endswith("ms")
+
+
+def test_db_pool_metrics(client):
+    response = client.get("/metrics/db-pool")
+    assert response.status_code == 200
+    assert "pool" in response.json()
+
+
+def test_current_user_cache(client, seed_session, redis_server, signing_key):
+    fastapp.dependency_overrides.pop(app.api.get_current_user)
+    key = RedisDB.select(RedisDB.DBs.CURRENT_ACTIVE_USERS).key("user@example.com")
+    token = app.api.create_access_token({"sub": "user@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+    # A miss loads the user from the database and caches its projection
+    assert client.get("/contacts/", headers=headers).status_code == 200
+    assert redis_server.get(key)
+    # A hit is served from the cache, the user row is not read again
+    seed_session.query(app.models.Contact).delete()
+    seed_session.query(app.models.User).delete()
+    seed_session.commit()
+    assert client.get("/contacts/", headers=headers).status_code == 200
+    # Without a cached record, a deleted user is rejected
+    redis_server.delete(key)
+    app.user_cache.local_users.clear()
+    assert client.get("/contacts/", headers=headers).status_code == 404
+
+
+def test_import_contacts_csv(sqlite_client, seed_session, mocker):
+    mocker.patch("app.contact_import.IMPORT_CHUNK_SIZE", 2)
+    csv = (
+        "first_name,last_name,email,phone_number,birth_date,additional_info\n"
+        "Ann,Lee,ann@example.com,555,1990-12-31,\n"
+        "Bad,Row,not-an-email,556,1990-01-01,\n"
+        # Duplicates a seeded contact, then a row of this upload
+        "Dup,Seed,contact1@example.com,000000001,1990-01-01,\n"
+        'Bob,Ray,bob@example.com,557,1991-02-03,"multi\nline"\n'
+        "Ann,Again,ann@example.com,555,1990-12-31,\n"
+    )
+    response = sqlite_client.post("/contacts/import", content=csv.encode())
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (2, 3)
+    assert [error["row"] for error in report["errors"]] == [2, 3, 5]
+    assert report["errors"][0]["errors"][0].startswith("email:")
+
+    contacts = sqlite_client.get("/contacts/", params={"limit": 100}).json()
+    ann, bob = contacts[-2:]
+    assert (ann["email"], bob["additional_info"]) == ("ann@example.com", "multi\nline")
+    # birthday_key is filled in although the ORM validator was bypassed
+    keys = seed_session.execute(
+        select(app.models.Contact.birthday_key).where(
+            app.models.Contact.id.in_([ann["id"], bob["id"]])
+        )
+    ).scalars()
+    assert sorted(keys) == [203, 1231]
+
+
+def test_import_contacts_created_concurrently(sqlite_client, mocker):
+    # The duplicate appears after the check, as if created concurrently
+    mocker.patch("app.contact_import.ContactImport._existing", return_value=set())
+    csv = (
+        "first_name,last_name,email,phone_number,birth_date\n"
+        "Dup,Seed,contact1@example.com,000000001,1990-01-01\n"
+        "Ann,Lee,ann@example.com,555,1990-12-31\n"
+    )
+    response = sqlite_client.post("/contacts/import", content=csv.encode())
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (1, 1)
+    assert report["errors"] == [
+        {"row": 1, "errors": ["Contact with this email already exists."]}
+    ]
+
+
+def test_import_contacts_with_stray_quotes(sqlite_client):
+    csv = (
+        "first_name,last_name,email,phone_number,birth_date,additional_info\n"
+        'Bob,Ray,bob@example.com,1,1990-01-01,5" tall\n'
+        "Ann,Lee,ann@example.com,2,1990-01-01,\n"
+    )
+    response = sqlite_client.post("/contacts/import", content=csv.encode())
+    assert response.json()["imported"] == 2
+    ndjson = [
+        json.dumps(
+            {
+                "first_name": name,
+                "last_name": "Lee",
+                "email": f"{i}@example.com",
+                "phone_number": str(i),
+                "birth_date": "1990-01-01",
+                "additional_info": '5" tall',
+            }
+        )
+        for i, name in enumerate(["Cy", "Di", "Ed"])
+    ]
+    response = sqlite_client.post(
+        "/contacts/import",
+        params={"format": "ndjson"},
+        content="\n".join(ndjson).encode(),
+    )
+    assert (response.json()["imported"], response.json()["failed"]) == (3, 0)
+
+
+def test_import_contacts_ndjson(sqlite_client):
+    lines = [
+        json.dumps(
+            {
+                "first_name": "Ann",
+                "last_name": "Lee",
+                "email": "ann@example.com",
+                "phone_number": "555",
+                "birth_date": "1990-12-31",
+            }
+        ),
+        "[1, 2]",
+        "{broken",
+    ]
+    response = sqlite_client.post(
+        "/contacts/import",
+        params={"format": "ndjson"},
+        content="\n".join(lines).encode(),
+    )
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (1, 2)
+    assert report["errors"][0] == {"row": 2, "errors": ["row: expected an object"]}
+    assert (
+        sqlite_client.post(
+            "/contacts/import", params={"format": "xml"}, content=b""
+        ).status_code
+        == 422
+    )
+
+
+def new_contact(email, phone_number="555"):
+    return {
+        "first_name": "New",
+        "last_name": "Contact",
+        "email": email,
+        "phone_number": phone_number,
+        "birth_date": "1990-12-31",
+    }
+
+
+def test_batch_contacts(sqlite_client, seed_session):
+    operations = [
+        {"op": "create", "contact": new_contact("new@example.com")},
+        {"op": "update", "id": 2, "contact": new_contact("moved@example.com")},
+        {"op": "delete", "id": 3},
+        {"op": "delete", "id": 3},
+        {"op": "update", "id": 999, "contact": new_contact("x@example.com")},
+        {"op": "update", "id": 5, "contact": new_contact("moved@example.com")},
+        # Same pair as the create above, and as contact 1
+        {"op": "create", "contact": new_contact("new@example.com")},
+        {"op": "create", "contact": new_contact("contact1@example.com", "000000001")},
+        # Contact 4's pair is free once it is deleted
+        {"op": "delete", "id": 4},
+        {"op": "create", "contact": new_contact("contact4@example.com", "000000004")},
+    ]
+    response = sqlite_client.post("/contacts/batch", json={"operations": operations})
+    assert response.status_code == 200
+    results = response.json()
+    assert [(r["op"], r["status"]) for r in results] == [
+        ("create", 201),
+        ("update", 200),
+        ("delete", 200),
+        ("delete", 404),
+        ("update", 404),
+        ("update", 409),
+        ("create", 409),
+        ("create", 409),
+        ("delete", 200),
+        ("create", 201),
+    ]
+    assert results[0]["id"] > 25 and results[9]["id"] > results[0]["id"]
+
+    contacts = {c["id"]: c for c in sqlite_client.get("/contacts/?limit=100").json()}
+    assert 3 not in contacts and 4 not in contacts
+    assert contacts[2]["email"] == "moved@example.com"
+    assert contacts[results[0]["id"]]["email"] == "new@example.com"
+    key = seed_session.scalar(
+        select(app.models.Contact.birthday_key).where(app.models.Contact.id == 2)
+    )
+    assert key == 1231
+
+
+def test_batch_contacts_swap_pairs(sqlite_client):
+    pair_of = {id: (f"contact{id}@example.com", f"{id:09d}") for id in (1, 2, 3)}
+    operations = [
+        # Contacts 1 and 2 swap their pairs through a temporary one
+        {"op": "update", "id": 1, "contact": new_contact("temp@example.com")},
+        {"op": "update", "id": 2, "contact": new_contact(*pair_of[1])},
+        {"op": "update", "id": 1, "contact": new_contact(*pair_of[2])},
+        # A direct swap fails on the pair still held by the other contact
+        {"op": "update", "id": 3, "contact": new_contact(*pair_of[1])},
+    ]
+    response = sqlite_client.post("/contacts/batch", json={"operations": operations})
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()] == [200, 200, 200, 409]
+    contacts = {c["id"]: c for c in sqlite_client.get("/contacts/?limit=3").json()}
+    assert (contacts[1]["email"], contacts[1]["phone_number"]) == pair_of[2]
+    assert (contacts[2]["email"], contacts[2]["phone_number"]) == pair_of[1]
+    assert contacts[3]["email"] == "contact3@example.com"
+
+
+def test_batch_contacts_concurrent_conflict(sqlite_client, mocker):
+    mocker.patch("app.api.apply_batch", side_effect=app.contact_batch.BatchConflict())
+    response = sqlite_client.post(
+        "/contacts/batch", json={"operations": [{"op": "delete", "id": 1}]}
+    )
+    assert response.status_code == 409
+
+
+def test_batch_contacts_validation(sqlite_client):
+    response = sqlite_client.post(
+        "/contacts/batch", json={"operations": [{"op": "update", "id": 1}]}
+    )
+    assert response.status_code == 422
+    response = sqlite_client.post(
+        "/contacts/batch", json={"operations": [{"op": "delete", "id": 1}] * 1001}
+    )
+    assert response.status_code == 422
+
+
+def no_db():
+    raise AssertionError("the database was used")
+
+
+def test_contacts_etag(sqlite_client):
+    response = sqlite_client.get("/contacts/", params={"limit": 5})
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+    # Other parameters make another representation
+    other = sqlite_client.get("/contacts/", params={"limit": 6}).headers["ETag"]
+    assert other != etag
+
+    # A match is answered from Redis alone
+    with patch.dict(fastapp.dependency_overrides, {app.db.get_db: no_db}):
+        response = sqlite_client.get(
+            "/contacts/", params={"limit": 5}, headers={"If-None-Match": etag}
+        )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    # Any change to the contacts moves the version on
+    sqlite_client.delete("/contacts/1")
+    response = sqlite_client.get(
+        "/contacts/", params={"limit": 5}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.parametrize("path", ["/search", "/birthdays"])
+def test_read_endpoints_etag(sqlite_client, path):
+    etag = sqlite_client.get(path).headers["ETag"]
+    response = sqlite_client.get(path, headers={"If-None-Match": f'"x", {etag}'})
+    assert response.status_code == 304
+    operations = [{"op": "delete", "id": 2}]
+    sqlite_client.post("/contacts/batch", json={"operations": operations})
+    assert sqlite_client.get(path, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_contact_reads_are_cached(sqlite_client, seed_session):
+    first = sqlite_client.get("/contacts/", params={"limit": 5})
+    assert sqlite_client.get("/contacts/1").json()["id"] == 1
+    # Served from the cache while the contacts are unchanged
+    seed_session.query(app.models.Contact).filter_by(id=1).update(
+        {"first_name": "Changed"}
+    )
+    seed_session.commit()
+    cached = sqlite_client.get("/contacts/", params={"limit": 5})
+    assert cached.content == first.content
+    assert cached.headers["X-Next-Cursor"] == "5"
+    assert sqlite_client.get("/contacts/1").json()["first_name"] == "First1"
+    assert sqlite_client.get("/contacts/999").status_code == 404
+
+    # A change through the API invalidates every cached response of the user
+    sqlite_client.delete("/contacts/2")
+    assert sqlite_client.get("/contacts/1").json()["first_name"] == "Changed"
+    page = sqlite_client.get("/contacts/", params={"limit": 5}).json()
+    assert [c["id"] for c in page] == [1, 3, 4, 5, 6]
+
+    status = sqlite_client.get("/metrics/cache").json()
+    assert status["hits"] >= 2 and status["misses"] >= 4
+
+
+def test_birthdays_etag_changes_daily(sqlite_client):
+    with patch("app.api.date") as mock_date:
+        mock_date.today.return_value = date(2025, 12, 30)
+        etag = sqlite_client.get("/birthdays").headers["ETag"]
+        mock_date.today.return_value = date(2025, 12, 31)
+        response = sqlite_client.get("/birthdays", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_export_contacts_csv(sqlite_client):
+    response = sqlite_client.get(
+        "/contacts/export",
+        params={"columns": "id,email"},
+        headers={"Accept-Encoding": "identity"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "content-encoding" not in response.headers
+    lines = response.text.splitlines()
+    assert lines[0] == "id,email"
+    assert lines[1] == "1,contact1@example.com"
+    assert len(lines) == 26
+
+
+def test_export_contacts_ndjson_gzip(sqlite_client, mocker):
+    mocker.patch("app.contact_export.EXPORT_BATCH_SIZE", 10)
+    with sqlite_client.stream(
+        "GET",
+        "/contacts/export",
+        params={"format": "ndjson"},
+        headers={"Accept-Encoding": "gzip"},
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+    rows = [json.loads(line) for line in gzip.decompress(raw).splitlines()]
+    assert [row["id"] for row in rows] == list(range(1, 26))
+    assert rows[0] == {
+        "id": 1,
+        "first_name": "First1",
+        "last_name": "Last1",
+        "email": "contact1@example.com",
+        "phone_number": "000000001",
+        "birth_date": "1990-01-01",
+        "additional_info": None,
+    }
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, gzipped",
+    [
+        ("gzip;q=0", False),
+        ("gzip;q=0, *", False),
+        ("br, gzip;q=0.5", True),
+        ("*", True),
+        ("identity, *;q=0", False),
+        ("gzipped", False),
+    ],
+)
+def test_export_contacts_negotiates_gzip(sqlite_client, accept_encoding, gzipped):
+    response = sqlite_client.get(
+        "/contacts/export", headers={"Accept-Encoding": accept_encoding}
+    )
+    assert response.status_code == 200
+    assert ("content-encoding" in response.headers) == gzipped
+    assert len(response.text.splitlines()) == 26
+
+
+def test_export_contacts_unknown_column(sqlite_client):
+    response = sqlite_client.get("/contacts/export", params={"columns": "password"})
+    assert response.status_code == 422
+
+
+def test_verified_token_cache(client, redis_server, signing_key):
+    fastapp.dependency_overrides.pop(app.api.get_current_user)
+    app.api.verified_tokens.clear()
+    token = app.api.create_access_token({"sub": "user@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+    with patch("app.api.jwt.decode", wraps=app.api.jwt.decode) as decode:
+        assert client.get("/contacts/", headers=headers).status_code == 200
+        assert client.get("/contacts/", headers=headers).status_code == 200
+    # The second request reused the verified claims
+    assert decode.call_count == 1
+
+    expired = app.api.create_access_token(
+        {"sub": "user@example.com"}, expires_delta=timedelta(seconds=-1)
+    )
+    headers = {"Authorization": f"Bearer {expired}"}
+    assert client.get("/contacts/", headers=headers).status_code == 401
+    assert len(app.api.verified_tokens) == 1
+
+
+def test_register_rejected_when_hashing_saturated(client):
+    with patch("app.api.password_hasher.hash", side_effect=HashingSaturated):
+        response = client.post(
+            "/register",
+            json={"email": "busy@example.com", "password": "password"},
+        )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/metrics/hashing").json()["workers"] >= 1
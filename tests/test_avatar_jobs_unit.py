@@ -0,0 +1,76 @@
+import pytest
+from app.avatar_jobs import AvatarQueue, get_job_status
+from app.models import User
+
+
+@pytest.fixture
+def users(seed_session):
+    seed_session.add_all(
+        [User(id=i, email=f"user{i}@example.com", password="x") for i in (1, 2)]
+    )
+    seed_session.commit()
+    return seed_session
+
+
+@pytest.mark.anyio
+async def test_queue_uploads_and_stores_avatars(
+    users, redis_server, cloudinary_server, avatar_sessions
+):
+    queue = AvatarQueue()
+    queue.sessions = avatar_sessions
+    await queue.start(workers=2)
+    images = f"{cloudinary_server.url}/images"
+    first = await queue.enqueue(1, "user1@example.com", f"{images}/one/1.png")
+    second = await queue.enqueue(2, "user2@example.com", f"{images}/two/2.png")
+    assert (await get_job_status(first))["status"] in ("queued", "uploading")
+    await queue.join()
+    await queue.stop()
+
+    assert len(cloudinary_server.uploads) == 2
+    avatars = set()
+    for job_id, user_id in ((first, 1), (second, 2)):
+        job = await get_job_status(job_id)
+        assert job["status"] == "done"
+        assert job["user_id"] == str(user_id)
+        users.expire_all()
+        assert users.get(User, user_id).avatar == job["avatar"]
+        avatars.add(job["avatar"])
+    assert len(avatars) == 2
+
+
+@pytest.mark.anyio
+async def test_failed_upload_keeps_avatar(
+    users, redis_server, cloudinary_server, avatar_sessions
+):
+    cloudinary_server.fail = True
+    queue = AvatarQueue()
+    await queue.start(workers=1)
+    url = f"{cloudinary_server.url}/images/one/1.png"
+    job_id = await queue.enqueue(1, "user1@example.com", url)
+    await queue.stop()  # Finishes the queued upload first
+
+    job = await get_job_status(job_id)
+    assert job["status"] == "failed"
+    assert "Invalid image file" in job["error"]
+    assert users.get(User, 1).avatar is None
+    assert await get_job_status("unknown") == {}
+
+
+@pytest.mark.anyio
+async def test_known_images_are_not_uploaded_again(
+    users, redis_server, cloudinary_server, avatar_sessions
+):
+    queue = AvatarQueue()
+    queue.sessions = avatar_sessions
+    await queue.start(workers=1)
+    images = f"{cloudinary_server.url}/images"
+    urls = (f"{images}/abc/a.png", f"{images}/abc/copy.png", f"{images}/abc/copy.png")
+    jobs = [await queue.enqueue(1, "user1@example.com", url) for url in urls]
+    await queue.stop()
+
+    # Fetched twice, the third job found the URL; uploaded once
+    assert len(cloudinary_server.fetches) == 2
+    assert len(cloudinary_server.uploads) == 1
+    statuses = [await get_job_status(job_id) for job_id in jobs]
+    assert {status["status"] for status in statuses} == {"done"}
+    assert len({status["avatar_large"] for status in statuses}) == 1
@@ -1,28 +1,90 @@
 import pytest
-from app.cloudinary_utils import upload_image
+from app.cloudinary_utils import (
+    AVATAR_VARIANTS,
+    avatar_variants,
+    fetch_image,
+    is_public_address,
+    upload_avatar,
+)
 from unittest.mock import patch
+from urllib.error import URLError
 
 
 @pytest.fixture
 def mock_cloudinary_response():
     return {
-        "secure_url": "https://res.cloudinary.com/demo/image/upload/v1234567890/sample.jpg"
+        "public_id": "avatars/abc",
+        "version": 1234567890,
+        "secure_url": "https://res.cloudinary.com/demo/image/upload/avatars/abc.png",
     }
 
 
 @patch("cloudinary.uploader.upload")
-def test_upload_image_success(mock_upload, mock_cloudinary_response):
+def test_upload_avatar_success(mock_upload, mock_cloudinary_response):
     mock_upload.return_value = mock_cloudinary_response
-    url = "https://example.com/sample.jpg"
-    result = upload_image(url)
-    assert result == mock_cloudinary_response["secure_url"]
-    mock_upload.assert_called_once_with(url)
+    assert upload_avatar(b"image", "abc") == mock_cloudinary_response
+    mock_upload.assert_called_once_with(
+        b"image", public_id="avatars/abc", overwrite=False
+    )
 
 
 @patch("cloudinary.uploader.upload")
-def test_upload_image_failure(mock_upload):
+def test_upload_avatar_failure(mock_upload):
     mock_upload.side_effect = Exception("Upload failed")
-    url = "https://example.com/sample.jpg"
     with pytest.raises(Exception, match="Upload failed"):
-        upload_image(url)
-    mock_upload.assert_called_once_with(url)
+        upload_avatar(b"image", "abc")
+    mock_upload.assert_called_once()
+
+
+def test_avatar_variants(cloudinary_server):
+    variants = avatar_variants("avatars/abc", version=3)
+    assert set(variants) == set(AVATAR_VARIANTS)
+    assert variants["medium"] == (
+        "https://res.cloudinary.com/test/image/upload/"
+        "c_fill,f_auto,g_face,h_256,q_auto,w_256/v3/avatars/abc"
+    )
+
+
+def test_fetch_image_rejects_other_schemes():
+    with pytest.raises(ValueError, match="http or https"):
+        fetch_image("file:///etc/passwd")
+
+
+def test_fetch_image_size_limit(cloudinary_server):
+    assert fetch_image(f"{cloudinary_server.url}/images/abc/a.png") == b"abc"
+    with patch("app.cloudinary_utils.AVATAR_MAX_BYTES", 2):
+        with pytest.raises(ValueError, match="larger than 2 bytes"):
+            fetch_image(f"{cloudinary_server.url}/images/abc/a.png")
+
+
+def test_is_public_address():
+    assert is_public_address("93.184.216.34")
+    assert is_public_address("2606:2800:220:1:248:1893:25c8:1946")
+    for address in (
+        "127.0.0.1",
+        "10.0.0.5",
+        "172.18.0.2",
+        "192.168.1.1",
+        "169.254.169.254",
+        "0.0.0.0",
+        "::1",
+        "fe80::1",
+        "fd00::1",
+        "::ffff:127.0.0.1",
+    ):
+        assert not is_public_address(address), address
+
+
+def test_fetch_image_rejects_private_addresses():
+    for url in ("http://127.0.0.1:1/a.png", "http://localhost/a.png"):
+        with pytest.raises(ValueError, match="public address"):
+            fetch_image(url)
+
+
+def test_fetch_image_checks_redirects(cloudinary_server):
+    redirect = f"{cloudinary_server.url}/redirect?"
+    assert fetch_image(f"{redirect}{cloudinary_server.url}/images/abc/a.png") == b"abc"
+    with pytest.raises(ValueError, match="public address"):
+        fetch_image(f"{redirect}http://169.254.169.254/latest/meta-data/")
+    with pytest.raises(URLError):
+        fetch_image(f"{redirect}ftp://10.0.0.5/a.png")
@@ -0,0 +1,58 @@
+import pytest
+from app.contact_import import iter_records, parse_csv, parse_ndjson
+
+
+async def chunked(data, size):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("size", [1, 3, 1024])
+async def test_iter_records_across_chunks(size):
+    data = 'a,b\r\n1,"two\nlines"\n"é",x'.encode()
+    records = await collect(iter_records(chunked(data, size)))
+    assert records == ["a,b\r\n", '1,"two\nlines"\n', '"é",x']
+
+
+@pytest.mark.anyio
+async def test_parse_csv():
+    data = b"\xef\xbb\xbffirst_name,additional_info\nJohn,\nJane,note\n\n"
+    rows = await collect(parse_csv(iter_records(chunked(data, 4))))
+    assert rows == [
+        {"first_name": "John", "additional_info": None},
+        {"first_name": "Jane", "additional_info": "note"},
+    ]
+
+
+@pytest.mark.anyio
+async def test_parse_ndjson():
+    data = b'{"first_name": "John"}\n\nnot json\n'
+    rows = await collect(parse_ndjson(iter_records(chunked(data, 5))))
+    assert rows[0] == {"first_name": "John"}
+    assert rows[1].startswith("row: invalid JSON")
+
+
+@pytest.mark.anyio
+async def test_ndjson_records_are_lines():
+    data = b'{"note": "5\\" tall"}\n{"n": 2}\n{"n": 3}\n'
+    rows = await collect(parse_ndjson(iter_records(chunked(data, 4), quoted=False)))
+    assert rows == [{"note": '5" tall'}, {"n": 2}, {"n": 3}]
+
+
+@pytest.mark.anyio
+async def test_stray_quote_in_csv(mocker):
+    mocker.patch("app.contact_import.IMPORT_MAX_RECORD_SIZE", 20)
+    data = b'name,note\nBob,5" tall\nAnn,x\nBad,a\rb\nJoe,y\nEve,z\n'
+    rows = await collect(parse_csv(iter_records(chunked(data, 3))))
+    # The lines joined by the quote are read one by one, up to the size cap
+    assert rows[:2] == [
+        {"name": "Bob", "note": '5" tall'},
+        {"name": "Ann", "note": "x"},
+    ]
+    assert rows[2].startswith("row: invalid CSV")
+    assert rows[3:] == [{"name": "Joe", "note": "y"}, {"name": "Eve", "note": "z"}]
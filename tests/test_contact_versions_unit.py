@@ -0,0 +1,31 @@
+import pytest
+from app.contact_versions import (
+    bump_contacts_version,
+    etag_matches,
+    get_contacts_version,
+    make_etag,
+)
+
+
+@pytest.mark.anyio
+async def test_versions_only_move_forward(redis_server):
+    first = int(await get_contacts_version(1))
+    assert int(await get_contacts_version(1)) == first
+    await bump_contacts_version(1)
+    assert int(await get_contacts_version(1)) == first + 1
+
+    # After Redis lost the key, versions still do not repeat
+    redis_server.delete("contacts_versions:1")
+    await bump_contacts_version(1)
+    assert int(await get_contacts_version(1)) > first + 1
+    assert await get_contacts_version(2) != await get_contacts_version(1)
+
+
+def test_etag_matches():
+    etag = make_etag("5", "/contacts/", ("limit", "5"))
+    assert etag != make_etag("5", "/contacts/", ("limit", "6"))
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag, f'"other", {etag.removeprefix("W/")}')
+    assert etag_matches(etag, "*")
+    assert not etag_matches(etag, None)
+    assert not etag_matches(etag, make_etag("6", "/contacts/", ("limit", "5")))
@@ -1,12 +1,26 @@
 import pytest
-from unittest.mock import patch, MagicMock
-from app.db import get_db
+import app.db
+from unittest.mock import patch, AsyncMock
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.db import (
+    InstrumentedPool,
+    async_database_url,
+    bind_shape,
+    dispose_engine,
+    engine_options,
+    get_db,
+    init_engine,
+    normalize_sql,
+    profile_queries,
+)
+from app.metrics import dependency_seconds
 
 
 @pytest.fixture
 def mock_db_session():
     """Fixture to provide a mocked database session."""
-    return MagicMock()
+    return AsyncMock()
 
 
 @pytest.fixture
@@ -16,8 +30,109 @@ def mock_session_local(mock_db_session):
         yield mock_db_session
 
 
-def test_get_db(mock_session_local):
+@pytest.mark.anyio
+async def test_get_db(mock_session_local):
     """Test that get_db() yields the mocked session."""
-    db_session = next(get_db())
+    sessions_timed = dependency_seconds.labels("db", "session").count
+    sessions = get_db()
+    db_session = await anext(sessions)
     assert db_session is mock_session_local
-    db_session.close.assert_called_once()
+    await sessions.aclose()
+    db_session.close.assert_awaited_once()
+    assert dependency_seconds.labels("db", "session").count == sessions_timed + 1
+
+
+def test_async_database_url():
+    """Test that sync drivers are replaced by their async counterparts."""
+    url = async_database_url("postgresql://user:pass@db:5432/contacts")
+    assert url.drivername == "postgresql+asyncpg"
+    assert url.database == "contacts"
+    assert url.query["prepared_statement_cache_size"] == "500"
+    url = async_database_url("postgresql+psycopg2://user:pass@db/contacts")
+    assert url.drivername == "postgresql+asyncpg"
+    assert async_database_url("sqlite:///test.db").drivername == "sqlite+aiosqlite"
+
+
+def test_engine_options():
+    """Test that pool settings apply to server databases only."""
+    assert engine_options(async_database_url("sqlite:///test.db")) == {}
+    with patch("app.db.DB_POOL_SIZE", 20), patch("app.db.DB_POOL_PRE_PING", False):
+        options = engine_options(async_database_url("postgresql://u:p@db/contacts"))
+    assert options["poolclass"] is InstrumentedPool
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 10
+    assert options["pool_pre_ping"] is False
+
+
+@pytest.mark.anyio
+async def test_engine_is_created_on_first_use(tmp_path):
+    """Test that the engine is created once and binds SessionLocal."""
+    sessions = async_sessionmaker()
+    url = f"sqlite:///{tmp_path / 'lazy.db'}"
+    with patch("app.db.engine", None), patch("app.db.SessionLocal", sessions), patch(
+        "app.db.DATABASE_URL", url
+    ):
+        engine = init_engine()
+        assert init_engine() is engine
+        async with sessions() as db:
+            assert await db.scalar(text("SELECT 1")) == 1
+        await dispose_engine()
+        assert app.db.engine is None
+
+
+@pytest.mark.anyio
+async def test_instrumented_pool_records_checkouts(tmp_path):
+    """Test that checkout waits and timeouts are recorded."""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedPool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    checkouts = app.db.pool_checkout_wait.count
+    timeouts = app.db.pool_checkout_timeouts
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        with pytest.raises(exc.TimeoutError):
+            await engine.connect().start()
+    await engine.dispose()
+    assert app.db.pool_checkout_wait.count == checkouts + 2
+    assert app.db.pool_checkout_timeouts == timeouts + 1
+
+
+def test_normalize_sql():
+    """Test that statements read the same whatever their number of values."""
+    assert normalize_sql("SELECT *\n  FROM contacts\n WHERE id IN (?, ?, ?)") == (
+        "SELECT * FROM contacts WHERE id IN (...)"
+    )
+    assert normalize_sql("SELECT * FROM t WHERE id IN ($1, $2)") == (
+        "SELECT * FROM t WHERE id IN (...)"
+    )
+    assert normalize_sql("SELECT * FROM t WHERE id = ?") == (
+        "SELECT * FROM t WHERE id = ?"
+    )
+
+
+def test_bind_shape():
+    """Test that parameters are described by type only."""
+    assert bind_shape((1, "secret")) == "(int, str)"
+    assert bind_shape({"id": 1, "email": "a@b.c"}) == "{id: int, email: str}"
+    assert bind_shape([(1,), (2,)], executemany=True) == "2 x (int)"
+
+
+@pytest.mark.anyio
+async def test_profile_queries_and_slow_query_log(tmp_path, caplog):
+    """Test that statements are counted per task and slow ones logged."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'q.db'}")
+    with profile_queries() as stats, patch("app.db.DB_SLOW_QUERY_MS", 0):
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1 WHERE 1 IN (1, 2)"))
+            await connection.execute(text("SELECT :a"), {"a": "secret"})
+    await engine.dispose()
+    assert stats.count == 2
+    assert stats.seconds > 0
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("SELECT 1 WHERE 1 IN (1, 2) ()" in m for m in messages)
+    assert any(m.endswith("SELECT ? (str)") for m in messages)
+    assert not any("secret" in m for m in messages)
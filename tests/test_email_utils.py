@@ -1,40 +1,143 @@
+import asyncio
 import pytest
-from unittest.mock import patch, ANY
-from app.email_utils import send_email
+import smtplib
+import socket
+from aiosmtpd.controller import Controller
+from app.email_utils import EmailQueue, get_delivery_status, is_transient
 
 
-@pytest.fixture
-def email_data():
-    return {
-        "receiver_email": "test@example.com",
-        "subject": "Test Subject",
-        "body": "This is a test email body.",
-    }
+class RecordingHandler:
+    """aiosmtpd handler keeping the received emails and SMTP sessions."""
 
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.failure_reply = "451 Try again later"
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        if self.failures:
+            self.failures -= 1
+            return self.failure_reply
+        self.messages.append(envelope)
+        return "250 OK"
 
-@pytest.fixture
-def mock_smtp(mocker):
-    return mocker.patch("app.email_utils.smtplib.SMTP")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
 
 
 @pytest.fixture
-def mock_getenv(mocker):
-    return mocker.patch(
-        "app.email_utils.os.getenv", side_effect=["sender@example.com", "password123"]
-    )
-
-
-def test_send_email(mock_getenv, mock_smtp, email_data):
-    mock_server = mock_smtp.return_value
-
-    send_email(email_data["receiver_email"], email_data["subject"], email_data["body"])
-
-    mock_getenv.assert_any_call("ENV_EMAIL")
-    mock_getenv.assert_any_call("ENV_EMAIL_PASSWORD")
-    mock_smtp.assert_called_with("smtp.gmail.com", 587)
-    mock_server.starttls.assert_called_once()
-    mock_server.login.assert_called_once_with("sender@example.com", "password123")
-    mock_server.sendmail.assert_called_once_with(
-        "sender@example.com", email_data["receiver_email"], ANY
-    )
-    mock_server.quit.assert_called_once()
+def smtp_server(mocker):
+    """Local SMTP stand-in the email queue delivers to."""
+    handler = RecordingHandler()
+    port = free_port()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    mocker.patch("app.email_utils.SMTP_HOST", "127.0.0.1")
+    mocker.patch("app.email_utils.SMTP_PORT", port)
+    mocker.patch("app.email_utils.SMTP_STARTTLS", False)
+    mocker.patch("app.email_utils.EMAIL_RETRY_BACKOFF", 0.01)
+    mocker.patch("app.email_utils.SMTP_USER", "sender@example.com")
+    mocker.patch("app.email_utils.SMTP_PASSWORD", None)
+    yield handler
+    controller.stop()
+
+
+async def wait_for_status(delivery_id, status):
+    for _ in range(200):
+        record = await get_delivery_status(delivery_id)
+        if record.get("status") == status:
+            return record
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"email {delivery_id} never became {status}: {record}")
+
+
+@pytest.mark.anyio
+async def test_queue_batches_over_one_connection(smtp_server, redis_server):
+    queue = EmailQueue()
+    await queue.start(workers=1)
+    ids = [
+        await queue.enqueue(f"user{i}@example.com", "Subject", f"Body {i}")
+        for i in range(5)
+    ]
+    for delivery_id in ids:
+        record = await wait_for_status(delivery_id, "sent")
+        assert record["attempts"] == "1"
+    await queue.stop()
+
+    assert [m.rcpt_tos for m in smtp_server.messages] == [
+        [f"user{i}@example.com"] for i in range(5)
+    ]
+    assert smtp_server.messages[0].mail_from == "sender@example.com"
+    # Every email went over the same SMTP session
+    assert len(smtp_server.sessions) == 1
+
+
+@pytest.mark.anyio
+async def test_queue_retries_with_backoff(smtp_server, redis_server):
+    smtp_server.failures = 2
+    queue = EmailQueue()
+    await queue.start(workers=1)
+    delivery_id = await queue.enqueue("user@example.com", "Subject", "Body")
+    record = await wait_for_status(delivery_id, "sent")
+    await queue.stop()
+    assert record["attempts"] == "3"
+    assert len(smtp_server.messages) == 1
+
+
+@pytest.mark.anyio
+async def test_queue_gives_up(smtp_server, redis_server, mocker):
+    mocker.patch("app.email_utils.EMAIL_MAX_ATTEMPTS", 2)
+    smtp_server.failures = 5
+    queue = EmailQueue()
+    await queue.start(workers=1)
+    delivery_id = await queue.enqueue("user@example.com", "Subject", "Body")
+    record = await wait_for_status(delivery_id, "failed")
+    await queue.stop()
+    assert record["attempts"] == "2"
+    assert "451" in record["error"]
+    assert smtp_server.messages == []
+
+
+@pytest.mark.anyio
+async def test_queue_does_not_retry_permanent_failures(smtp_server, redis_server):
+    smtp_server.failures = 1
+    smtp_server.failure_reply = "550 No such user"
+    queue = EmailQueue()
+    await queue.start(workers=1)
+    delivery_id = await queue.enqueue("user@example.com", "Subject", "Body")
+    record = await wait_for_status(delivery_id, "failed")
+    await queue.stop()
+    assert record["attempts"] == "1"
+    assert "550" in record["error"]
+
+
+def test_is_transient():
+    assert is_transient(smtplib.SMTPDataError(451, "Try again later"))
+    assert not is_transient(smtplib.SMTPDataError(550, "No such user"))
+    refused = {"a@example.com": (450, b"Busy"), "b@example.com": (550, b"Unknown")}
+    assert not is_transient(smtplib.SMTPRecipientsRefused(refused))
+    assert is_transient(smtplib.SMTPServerDisconnected())
+    assert is_transient(ConnectionRefusedError())
+    assert not is_transient(smtplib.SMTPNotSupportedError())
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("failures, status", [(1, "sent"), (2, "failed")])
+async def test_stop_flushes_retries(
+    smtp_server, redis_server, mocker, failures, status
+):
+    mocker.patch("app.email_utils.EMAIL_RETRY_BACKOFF", 60)
+    smtp_server.failures = failures
+    queue = EmailQueue()
+    await queue.start(workers=1)
+    delivery_id = await queue.enqueue("user@example.com", "Subject", "Body")
+    await wait_for_status(delivery_id, "retrying")
+    # Sent once more instead of waiting for the backoff, then not retried
+    await queue.stop()
+    record = await get_delivery_status(delivery_id)
+    assert (record["status"], record["attempts"]) == (status, "2")
@@ -0,0 +1,33 @@
+import asyncio
+import pytest
+import threading
+from app.hashing import HashingSaturated, PasswordHasher
+
+
+@pytest.mark.anyio
+async def test_hash_and_verify():
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    hashed = await hasher.hash("password")
+    assert hashed != "password"
+    assert await hasher.verify("password", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    status = hasher.status()
+    assert status["hash_seconds"]["count"] == 3
+    assert status["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_rejects_when_saturated():
+    hasher = PasswordHasher(workers=1, queue_size=1)
+    release = threading.Event()
+    running = [asyncio.create_task(hasher._run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    assert hasher.status()["queue_depth"] == 1
+    with pytest.raises(HashingSaturated):
+        await hasher.hash("password")
+    assert hasher.rejected == 1
+
+    release.set()
+    assert await asyncio.gather(*running) == [True, True]
+    assert hasher.in_flight == 0
+    assert hasher.status()["queue_wait_seconds"]["count"] == 2
@@ -0,0 +1,47 @@
+from unittest.mock import patch
+from app.local_cache import LocalCache
+
+
+def test_get_and_set():
+    cache = LocalCache(maxsize=10, ttl=60)
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert len(cache) == 1
+
+
+def test_entries_expire():
+    cache = LocalCache(maxsize=10, ttl=60)
+    with patch("app.local_cache.time.monotonic", return_value=1000):
+        cache.set("default", 1)
+        cache.set("short", 2, ttl=5)
+        cache.set("deadline", 3, expires_at=1010)
+    with patch("app.local_cache.time.monotonic", return_value=1006):
+        assert cache.get("short") is None
+        assert cache.get("deadline") == 3
+    with patch("app.local_cache.time.monotonic", return_value=1059):
+        assert cache.get("deadline") is None
+        assert cache.get("default") == 1
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_used():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_pop_and_clear():
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "missing") == "missing"
+    cache.clear()
+    assert len(cache) == 0
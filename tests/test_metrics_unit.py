@@ -0,0 +1,69 @@
+import pytest
+from app.metrics import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    format_labels,
+    timed,
+)
+
+
+@pytest.fixture
+def metric():
+    metrics = []
+
+    def make(*args):
+        metrics.append(Metric(*args))
+        return metrics[-1]
+
+    yield make
+    for created in metrics:
+        REGISTRY.remove(created)
+
+
+def test_render_counter_and_gauge(metric):
+    requests = metric("requests_total", "Requests.", Counter, ("route",))
+    requests.labels("/a").inc()
+    requests.labels("/a").inc(2)
+    in_progress = metric("in_progress", "In progress.", Gauge)
+    in_progress.labels().inc()
+    in_progress.labels().dec()
+    assert requests.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a"} 3'
+    )
+    assert in_progress.render().endswith("\nin_progress 0")
+
+
+def test_render_histogram(metric):
+    latency = metric("latency_seconds", "Latency.", Histogram, ("route",))
+    latency.labels("/a").observe(0.003)
+    lines = latency.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a",le="0.001"} 0' in lines
+    assert 'latency_seconds_bucket{route="/a",le="0.005"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 1' in lines
+    assert 'latency_seconds_sum{route="/a"} 0.003' in lines
+    assert 'latency_seconds_count{route="/a"} 1' in lines
+
+
+def test_format_labels_escapes_values():
+    assert format_labels({}) == ""
+    assert format_labels({"a": 'x"y\\z\n'}) == r'{a="x\"y\\z\n"}'
+
+
+def test_timed_counts_errors():
+    from app.metrics import dependency_errors, dependency_seconds
+
+    seconds = dependency_seconds.labels("test", "op")
+    errors = dependency_errors.labels("test", "op")
+    calls, failures = seconds.count, errors.value
+    with timed("test", "op"):
+        pass
+    with pytest.raises(ValueError):
+        with timed("test", "op"):
+            raise ValueError()
+    assert seconds.count == calls + 2
+    assert errors.value == failures + 1
@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import patch
+from app.rate_limit import RateLimiter, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate("5/minute") == (5, 60)
+    assert parse_rate("1000/day") == (1000, 86400)
+    with pytest.raises(KeyError):
+        parse_rate("5/fortnight")
+
+
+@pytest.mark.anyio
+async def test_limit_is_shared_by_workers(redis_server):
+    workers = [RateLimiter(), RateLimiter()]
+    allowed = [await workers[i % 2].hit("me", "user:1") is None for i in range(8)]
+    assert allowed == [True] * 5 + [False] * 3
+    assert redis_server.zcard("rate_limits:me:user:1") == 5
+    # Other users and routes have their own windows
+    assert await workers[0].hit("me", "user:2") is None
+
+
+@pytest.mark.anyio
+async def test_leases_skip_redis_while_far_from_limit(redis_server):
+    limiter = RateLimiter()
+    with patch.dict("app.rate_limit.RATE_LIMITS", {"bulk": "100/minute"}):
+        for _ in range(10):
+            assert await limiter.hit("bulk", "ip:1.2.3.4") is None
+        assert limiter.status() == {"local": 9, "remote": 1, "rejected": 0}
+
+        # Past half the limit, requests are taken from Redis one at a time
+        for _ in range(90):
+            assert await limiter.hit("bulk", "ip:1.2.3.4") is None
+        assert limiter.remote > 1
+        assert await limiter.hit("bulk", "ip:1.2.3.4") is not None
+    assert redis_server.zcard("rate_limits:bulk:ip:1.2.3.4") == 100
+
+
+@pytest.mark.anyio
+async def test_rejected_keys_wait_locally(redis_server):
+    limiter = RateLimiter()
+    for _ in range(5):
+        await limiter.hit("me", "user:1")
+    retry_after = await limiter.hit("me", "user:1")
+    assert 0 < retry_after <= 60
+    remote = limiter.remote
+    assert 0 < await limiter.hit("me", "user:1") <= retry_after
+    assert limiter.remote == remote
+    assert limiter.rejected == 2
+
+
+@pytest.mark.anyio
+async def test_allows_requests_without_redis(redis_server):
+    limiter = RateLimiter()
+    with patch.object(limiter, "_take", side_effect=ConnectionError):
+        assert await limiter.hit("me", "user:1") is None
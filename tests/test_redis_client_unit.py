@@ -1,29 +1,39 @@
 import pytest
-from app.redis_client import RedisDB
-from unittest.mock import patch, MagicMock
+from app.redis_client import RedisDB, RedisNamespace
 
 
-@pytest.fixture
-def redis_mock():
-    with patch("redis.Redis", MagicMock()) as mock:
-        yield mock
-
-
-def test_singleton_instance(redis_mock):
+def test_singleton_instance():
     instance1 = RedisDB()
     instance2 = RedisDB()
     assert instance1 is instance2
 
 
-def test_redis_clients_initialization(redis_mock):
-    instance = RedisDB()
-    for db in RedisDB.DBs:
-        assert db in instance._clients
-        assert isinstance(instance._clients[db], MagicMock)
+def test_pool_configuration():
+    pool = RedisDB().client.connection_pool
+    assert pool.max_connections == 50
+    assert pool.timeout == 5
+    assert pool.connection_kwargs["socket_timeout"] == 2
+    assert pool.connection_kwargs["health_check_interval"] == 30
 
 
-def test_select_method(redis_mock):
+def test_namespaces_share_one_client(redis_server):
     instance = RedisDB()
+    prefixes = set()
     for db in RedisDB.DBs:
-        client = instance.select(db)
-        assert client is instance._clients[db]
+        namespace = instance.select(db)
+        assert isinstance(namespace, RedisNamespace)
+        assert namespace.client is instance.client
+        prefixes.add(namespace.prefix)
+    assert len(prefixes) == len(RedisDB.DBs)
+
+
+@pytest.mark.anyio
+async def test_namespace_prefixes_keys(redis_server):
+    pending = RedisDB.select(RedisDB.DBs.PENDING_USERS)
+    active = RedisDB.select(RedisDB.DBs.CURRENT_ACTIVE_USERS)
+    await pending.set("user@example.com", "pending")
+    await active.set("user@example.com", "active", ex=60)
+    assert await pending.get("user@example.com") == "pending"
+    assert await active.get("user@example.com") == "active"
+    assert redis_server.get("pending_users:user@example.com") == "pending"
+    assert redis_server.ttl("current_active_users:user@example.com") > 0
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.response_cache import ResponseCache, cache_key
+
+
+@pytest.fixture
+def sessions():
+    """Session factory the caches compute their responses on."""
+    return async_sessionmaker(create_async_engine("sqlite+aiosqlite://"))
+
+
+def make_cache(sessions):
+    cache = ResponseCache()
+    cache.sessions = sessions
+    return cache
+
+
+def test_cache_key_normalizes_params():
+    key = cache_key(1, "7", "contacts", {"limit": 10, "after": None})
+    assert key == cache_key(1, "7", "contacts", {"after": None, "limit": 10})
+    assert key.startswith("1:7:contacts:")
+    assert key != cache_key(1, "8", "contacts", {"limit": 10, "after": None})
+
+
+@pytest.mark.anyio
+async def test_hit_after_miss(redis_server, sessions):
+    cache = make_cache(sessions)
+
+    async def load(db):
+        return b"[1]", {"X-Next-Cursor": "1"}
+
+    assert await cache.get_or_load("key", load) == (b"[1]", {"X-Next-Cursor": "1"})
+    assert await cache.get_or_load("key", load) == (b"[1]", {"X-Next-Cursor": "1"})
+    assert redis_server.ttl("response_cache:key") > 0
+    assert not redis_server.exists("response_cache:key:lock")
+    status = cache.status()
+    assert (status["hits"], status["misses"], status["hit_ratio"]) == (1, 1, 0.5)
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_load_once(redis_server, sessions):
+    calls = 0
+
+    async def load(db):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return b"[]", {}
+
+    worker, other_worker = make_cache(sessions), make_cache(sessions)
+    results = await asyncio.gather(
+        *(worker.get_or_load("key", load) for _ in range(10)),
+        other_worker.get_or_load("key", load),
+    )
+    assert results == [(b"[]", {})] * 11
+    assert calls == 1
+    assert worker.coalesced == 9
+    assert other_worker.lock_waits == 1
+
+
+@pytest.mark.anyio
+async def test_failed_load_is_not_cached(redis_server, sessions):
+    cache = make_cache(sessions)
+
+    async def load(db):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await cache.get_or_load("key", load)
+    assert not redis_server.exists("response_cache:key", "response_cache:key:lock")
+
+
+@pytest.mark.anyio
+async def test_cancelled_first_request_does_not_fail_waiters(redis_server, sessions):
+    cache = make_cache(sessions)
+
+    async def load(db):
+        await asyncio.sleep(0.1)
+        return str((await db.execute(text("SELECT 1"))).scalar()).encode(), {}
+
+    first = asyncio.create_task(cache.get_or_load("key", load))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(cache.get_or_load("key", load))
+    await asyncio.sleep(0.01)
+    # The first client disconnects while the second awaits its result
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await second == (b"1", {})
+    assert cache.coalesced == 1
@@ -0,0 +1,60 @@
+import pytest
+from datetime import date
+from app.models import Contact
+from app.search import TrigramIndex, escape_like, similarity, trigrams
+
+
+def make_contact(id, first_name, last_name, email):
+    return Contact(
+        id=id,
+        first_name=first_name,
+        last_name=last_name,
+        email=email,
+        phone_number="123456789",
+        birth_date=date(1990, 1, 1),
+        user_id=1,
+    )
+
+
+@pytest.fixture
+def index():
+    return TrigramIndex(
+        [
+            make_contact(1, "Johnny", "Walker", "johnny@example.com"),
+            make_contact(2, "John", "Doe", "john.doe@example.com"),
+            make_contact(3, "Jane", "Doe", "jane@example.com"),
+            make_contact(4, "Al", "Bo", "al@example.com"),
+        ]
+    )
+
+
+def test_trigrams_match_pg_trgm():
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+    assert trigrams("Foo-bar") == trigrams("foo") | trigrams("bar")
+
+
+def test_similarity():
+    assert similarity("john", "john") == 1.0
+    assert similarity("john", "xyz") == 0.0
+    assert similarity("john", "johnny") > similarity("john", "jo")
+
+
+def test_escape_like():
+    assert escape_like("50%_off\\") == "50\\%\\_off\\\\"
+
+
+def test_index_substring_search(index):
+    result = index.search({"first_name": "OHN"}, 10)
+    # The closer match ranks first
+    assert [c.id for c in result] == [2, 1]
+
+
+def test_index_all_terms_must_match(index):
+    result = index.search({"first_name": "j", "last_name": "doe"}, 10)
+    assert [c.id for c in result] == [2, 3]
+
+
+def test_index_short_terms_and_limit(index):
+    assert [c.id for c in index.search({"last_name": "o"}, 2)] == [2, 3]
+    assert index.search({"email": "nobody"}, 10) == []
+    assert len(index.search({}, 10)) == 4
@@ -0,0 +1,41 @@
+import os
+import pytest
+import subprocess
+import sys
+from pydantic import ValidationError
+from app.settings import Settings
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_settings_from_env():
+    settings = Settings.from_env(
+        {"DB_POOL_SIZE": "20", "SMTP_STARTTLS": "false", "REDIS_PORT": "6380"}
+    )
+    assert settings.db_pool_size == 20
+    assert settings.smtp_starttls is False
+    assert settings.redis_port == 6380
+    # Unset variables keep their default
+    assert settings.db_pool_timeout == 30
+    assert settings.database_url is None
+    with pytest.raises(ValidationError):
+        Settings.from_env({"DB_POOL_SIZE": "many"})
+
+
+def test_importing_the_app_creates_no_clients():
+    # In a fresh interpreter, as the tests already imported everything
+    code = (
+        "import sys, app.main, app.db; "
+        "print(app.db.engine, *sorted(m.split('.')[0] for m in sys.modules "
+        "if m.split('.')[0] in ('asyncpg', 'cloudinary', 'passlib', 'jsonpickle')))"
+    )
+    environment = {**os.environ, "DATABASE_URL": "postgresql://u:p@localhost/db"}
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+        env=environment,
+    )
+    assert result.stdout.split() == ["None"]
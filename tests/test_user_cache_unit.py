@@ -0,0 +1,103 @@
+import asyncio
+import jsonpickle
+import orjson
+import pytest
+from app.models import User
+from app.schemas import CurrentUser
+from app.user_cache import (
+    INVALIDATION_CHANNEL,
+    USER_CACHE_VERSION,
+    cache_user,
+    decode_user,
+    encode_user,
+    get_cached_user,
+    invalidate_user,
+    listen_for_invalidations,
+    local_users,
+)
+
+
+def make_user():
+    return User(
+        id=7,
+        email="user@example.com",
+        password="hashed_password",
+        avatar="http://example.com/avatar.png",
+        role="ADMIN",
+    )
+
+
+def test_encode_user_is_compact_projection():
+    record = orjson.loads(encode_user(make_user()))
+    assert record == {
+        "v": USER_CACHE_VERSION,
+        "id": 7,
+        "email": "user@example.com",
+        "role": "ADMIN",
+        "avatar": "http://example.com/avatar.png",
+        "avatar_variants": None,
+    }
+
+
+def test_round_trip():
+    user = decode_user(encode_user(make_user()).decode())
+    assert isinstance(user, CurrentUser)
+    assert (user.id, user.email, user.role, user.avatar) == (
+        7,
+        "user@example.com",
+        "ADMIN",
+        "http://example.com/avatar.png",
+    )
+
+
+def test_decode_misses():
+    assert decode_user(None) is None
+    assert decode_user("not json") is None
+    # Records of another format version, or the old jsonpickle entries
+    stale = orjson.loads(encode_user(make_user()))
+    stale["v"] = USER_CACHE_VERSION + 1
+    assert decode_user(orjson.dumps(stale)) is None
+    assert decode_user(jsonpickle.dumps(make_user())) is None
+
+
+def make_current_user(avatar=None):
+    return CurrentUser(id=7, email="user@example.com", role="USER", avatar=avatar)
+
+
+@pytest.mark.anyio
+async def test_two_tier_lookup(redis_server):
+    await cache_user(make_current_user())
+    assert local_users.get("user@example.com") is not None
+    assert redis_server.get("current_active_users:user@example.com")
+
+    # A cold worker reads Redis once, then serves from memory
+    local_users.clear()
+    assert (await get_cached_user("user@example.com")).id == 7
+    redis_server.delete("current_active_users:user@example.com")
+    assert (await get_cached_user("user@example.com")).id == 7
+    assert await get_cached_user("other@example.com") is None
+
+
+@pytest.mark.anyio
+async def test_invalidation_reaches_other_workers(redis_server):
+    listener = asyncio.create_task(listen_for_invalidations())
+    await asyncio.sleep(0.05)
+    # Another worker's copy, the Redis record, and the invalidation it sends
+    local_users.set("user@example.com", make_current_user())
+    redis_server.set("current_active_users:user@example.com", b"record")
+    redis_server.publish(INVALIDATION_CHANNEL, "user@example.com")
+    for _ in range(100):
+        if local_users.get("user@example.com") is None:
+            break
+        await asyncio.sleep(0.01)
+    assert local_users.get("user@example.com") is None
+
+    local_users.set("user@example.com", make_current_user())
+    await invalidate_user("user@example.com")
+    assert local_users.get("user@example.com") is None
+    assert not redis_server.exists("current_active_users:user@example.com")
+    # Let the listener take its own invalidation before cancelling it
+    await asyncio.sleep(0.05)
+    listener.cancel()
+    await asyncio.wait([listener], timeout=1)
+    assert listener.done()